@@ -32,7 +32,10 @@ class DomainEvent(BaseModel):
     @model_serializer(mode="wrap")
     def __serialize_model(self, serializer: SerializerFunctionWrapHandler):
         data = serializer(self)
-        return {k: v for k, v in data.items() if v is not None}
+        # Se eliminan los None in-place: sin None (lo habitual) no se crea otro dict
+        for key in [k for k, v in data.items() if v is None]:
+            del data[key]
+        return data
 
 
 class DomainEventContainer:
@@ -512,6 +512,8 @@ class RequestBuilder:
 
     def __init__(self, type_inspector: TypeInspector):
         self.type_inspector = type_inspector
+        # Campos de cada modelo form_data como (nombre, es File), una vez por clase
+        self._form_fields_cache: Dict[Type[BaseModel], Tuple[Tuple[str, bool], ...]] = {}
 
     def build_request(
         self,
@@ -659,12 +661,12 @@ class RequestBuilder:
         data: Dict[str, Any] = {}
         files: List[Tuple[str, Tuple[str | None, bytes | str, str | None]]] = []
 
-        for field_name, field_info in form_data_obj.model_fields.items():
+        for field_name, is_file in self._get_form_fields(type(form_data_obj)):
             value = getattr(form_data_obj, field_name)
             if value is None:
                 continue
 
-            if self.type_inspector.is_file_type(field_info.annotation):
+            if is_file:
                 if isinstance(value, list):
                     for f in value:
                         files.append(
@@ -693,6 +695,18 @@ class RequestBuilder:
 
         return (data or None), (files or None)
 
+    def _get_form_fields(
+        self, model_class: Type[BaseModel]
+    ) -> Tuple[Tuple[str, bool], ...]:
+        """Materializa una vez por clase los campos y si son de tipo File"""
+        form_fields = self._form_fields_cache.get(model_class)
+        if form_fields is None:
+            form_fields = self._form_fields_cache[model_class] = tuple(
+                (field_name, self.type_inspector.is_file_type(field_info.annotation))
+                for field_name, field_info in model_class.model_fields.items()
+            )
+        return form_fields
+
 
 class ResponseParser:
     """Responsable de parsear las respuestas HTTP"""
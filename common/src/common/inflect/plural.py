@@ -1,6 +1,10 @@
+from functools import lru_cache
+
 import inflect
 
 p = inflect.engine()
 
+# El conjunto de nombres es el de las clases del modelo: se calcula una vez
+@lru_cache(maxsize=None)
 def plural(name:str)->str:
     return p.plural(name)
\ No newline at end of file
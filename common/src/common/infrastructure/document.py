@@ -9,6 +9,8 @@ from typing import (
     List,
     Dict,
     Callable,
+    ClassVar,
+    NamedTuple,
     Optional,
 )
 from common.util import get_id
@@ -25,12 +27,30 @@ from pydantic import (
 from pydantic.fields import FieldInfo
 from pydantic_core.core_schema import FieldValidationInfo
 from common.inflect import plural
+import inspect
 import re
 
 
 # Constante para placeholders
 PLACEHOLDER_PATTERN = re.compile(r"\{([^}]+)\}")
 
+# Placeholders con entidad: {EntityName.field}
+ENTITY_PLACEHOLDER_PATTERN = re.compile(r"\{([^.]+)\.([^}]+)\}")
+
+# Placeholders sin entidad: {field}
+FIELD_PLACEHOLDER_PATTERN = re.compile(r"\{([^.}]+)\}")
+
+# Tipos primitivos que se serializan tal cual (comparación por type() exacto)
+_PRIMITIVE_TYPES = frozenset({str, int, float, bool, type(None), UUID})
+
+_MISSING = object()
+
+# Contenedores que se serializan elemento a elemento (comparación por type() exacto)
+_ITERABLE_TYPES = frozenset({list, tuple, set})
+
+# Estrategias cuyos valores list/set/tuple se serializan como un campo normal
+_DIRECT_ITERABLE_STRATEGIES = frozenset({"direct", "geopoint_value"})
+
 
 def id():
     return Field(metadata={"id": True}, default_factory=lambda: get_id())
@@ -49,6 +69,14 @@ def geopoint():
     return Field(metadata={"geopoint": True})
 
 
+def _get_field_metadata(field_info: FieldInfo) -> Dict[str, Any]:
+    """Extrae la metadata de id()/reference()/collection()/geopoint() de un FieldInfo"""
+    extra = field_info.json_schema_extra
+    if not isinstance(extra, dict):
+        return {}
+    return extra.get("metadata", {})
+
+
 # ===== CLASES BASE =====
 
 
@@ -62,11 +90,12 @@ class BaseReference(BaseModel):
     def _serialize_model(
         self, serializer: SerializerFunctionWrapHandler, info: SerializationInfo
     ):
-        data = serializer(self)
+        # Es frozen: en modo python se devuelve la misma instancia en vez de
+        # serializarla y volver a validarla en una copia
         if info.mode == "json":
-            return data
+            return serializer(self)
         else:
-            return self.__class__(**data)
+            return self
 
 
 class DocumentId(BaseReference):
@@ -96,11 +125,227 @@ class GeoPointValue(BaseModel):
     def _serialize_model(
         self, serializer: SerializerFunctionWrapHandler, info: SerializationInfo
     ):
-        data = serializer(self)
+        # Frozen, igual que BaseReference: en modo python la misma instancia
         if info.mode == "json":
-            return data
+            return serializer(self)
         else:
-            return GeoPointValue(**data)
+            return self
+
+
+# ===== METADATA COMPILADA DEL SCHEMA =====
+
+
+class FieldMeta(NamedTuple):
+    """Estrategia de serialización de un campo, compilada una vez desde el schema"""
+
+    strategy: str
+    path: str = ""  # path_resolver (reference), path_pattern (collection) o collection_name (id)
+    reference_field: str = "id"
+    element_entity: Optional[str] = None
+    resolver: Optional[Callable[[Any], str]] = None  # path_resolver precompilado
+    dispatch_iterables: bool = False  # list/set/tuple pasan por _serialize_collection_or_set
+    serializer: Optional[Callable[..., Any]] = None  # handler de la estrategia (self, value, meta, info)
+
+
+def _compile_reference_resolver(path_pattern: str) -> Callable[[Any], str]:
+    """
+    Precompila un path_resolver a una función item -> path.
+    
+    El pattern se trocea una sola vez en (literal, campo, placeholder); en cada
+    llamada solo se leen los campos del item referenciado y se concatenan.
+    
+    Ejemplo:
+    Pattern: "categories/{Category.id}"
+    Item:    Category(id=123, ...)
+    Result:  "categories/123"
+    """
+    # split alterna literal, entidad, campo, literal, ... en una sola pasada
+    parts = ENTITY_PLACEHOLDER_PATTERN.split(path_pattern)
+    segments = [
+        (parts[i], parts[i + 2], f"{{{parts[i + 1]}.{parts[i + 2]}}}")
+        for i in range(0, len(parts) - 1, 3)
+    ]
+    tail = parts[-1]
+
+    if not segments:
+        return lambda referenced_item: path_pattern
+
+    if len(segments) == 1:
+        # Caso habitual ("categories/{Category.id}"): plantilla % precompilada
+        literal, field_name, placeholder = segments[0]
+        template = literal.replace("%", "%%") + "%s" + tail.replace("%", "%%")
+
+        def resolve_single(referenced_item: Any) -> str:
+            values = getattr(referenced_item, "__dict__", None) or {}
+            field_value = values.get(field_name, _MISSING)
+            if field_value is _MISSING:
+                field_value = getattr(referenced_item, field_name, _MISSING)
+            return template % (placeholder if field_value is _MISSING else field_value,)
+
+        return resolve_single
+
+    def resolve(referenced_item: Any) -> str:
+        # Los campos pydantic viven en __dict__: se lee una vez por item y solo
+        # lo que no esté ahí (properties, objetos sin __dict__) pasa por getattr
+        values = getattr(referenced_item, "__dict__", None) or {}
+        parts = []
+        for literal, field_name, placeholder in segments:
+            parts.append(literal)
+            # El valor viene del objeto referenciado; sin el campo se deja el placeholder
+            field_value = values.get(field_name, _MISSING)
+            if field_value is _MISSING:
+                field_value = getattr(referenced_item, field_name, _MISSING)
+            parts.append(placeholder if field_value is _MISSING else str(field_value))
+        parts.append(tail)
+        return "".join(parts)
+
+    return resolve
+
+
+def _compile_field_meta(
+    field_schema: Dict[str, Any], collection_name: str = ""
+) -> FieldMeta:
+    """
+    Convierte el schema de un campo en FieldMeta.
+    
+    collection_name es el de la entidad si es un document; el campo id lo usa
+    para construir su DocumentId sin volver a consultar entity_metadata.
+    """
+    strategy = field_schema.get("strategy", "direct")
+    dispatch_iterables = strategy not in _DIRECT_ITERABLE_STRATEGIES
+
+    if strategy == "id_field":
+        return FieldMeta(strategy, path=collection_name, dispatch_iterables=dispatch_iterables)
+
+    if strategy == "reference_path":
+        reference_metadata = field_schema.get("reference_metadata", {})
+        path_resolver = reference_metadata.get("path_resolver", "")
+        return FieldMeta(
+            strategy,
+            path=path_resolver,
+            resolver=_compile_reference_resolver(path_resolver),
+            dispatch_iterables=dispatch_iterables,
+        )
+
+    if strategy == "collection_with_paths":
+        collection_metadata = field_schema.get("collection_metadata", {})
+        return FieldMeta(
+            strategy,
+            path=collection_metadata.get("path_pattern", ""),
+            reference_field=collection_metadata.get("reference_field", "id"),
+            element_entity=collection_metadata.get("element_entity"),
+            dispatch_iterables=dispatch_iterables,
+        )
+
+    return FieldMeta(strategy, dispatch_iterables=dispatch_iterables)
+
+
+def _compile_schema(schema: Dict[str, Any]) -> Dict[str, Dict[str, FieldMeta]]:
+    """
+    Compila las properties de cada entidad del schema a FieldMeta.
+    
+    Solo se guardan los campos con estrategia especial: un campo "direct" se
+    serializa igual que uno sin metadata, así el lookup falla rápido.
+    """
+    compiled = {}
+    for entity_name, entity_schema in schema.items():
+        entity_metadata = entity_schema.get("entity_metadata", {})
+        collection_name = ""
+        if entity_metadata.get("type") == "document":
+            collection_name = entity_metadata.get("collection_name") or ""
+        compiled[entity_name] = {
+            field_name: _bind_strategy_serializer(_compile_field_meta(field_schema, collection_name))
+            for field_name, field_schema in entity_schema.get("properties", {}).items()
+            if field_schema.get("strategy", "direct") != "direct"
+        }
+    return compiled
+
+
+def _bind_strategy_serializer(field_meta: FieldMeta) -> FieldMeta:
+    """Resuelve el handler de la estrategia una vez, en lugar de un match por valor"""
+    return field_meta._replace(
+        serializer=_STRATEGY_SERIALIZERS.get(field_meta.strategy, _serialize_as_normal_field)
+    )
+
+
+# Patterns de collection ya troceados, por path_pattern
+_COLLECTION_PATH_SEGMENTS: Dict[str, Tuple[Tuple[Any, ...], ...]] = {}
+
+
+def _split_field_placeholders(text: str) -> Tuple[Tuple[str, Optional[str]], ...]:
+    """Trocea text en (literal, campo) según sus placeholders sin entidad {field}"""
+    # split alterna literal, campo, literal, ...; el último literal no lleva campo
+    parts = FIELD_PLACEHOLDER_PATTERN.split(text)
+    return tuple(zip(parts[::2], parts[1::2] + [None]))
+
+
+def _compile_collection_path(path_pattern: str) -> Tuple[Tuple[Any, ...], ...]:
+    """
+    Trocea un path_pattern de collection en segmentos
+    (literal, entidad, campo, placeholder), una sola vez por pattern.
+    
+    literal y placeholder vienen ya troceados por _split_field_placeholders;
+    placeholder es el texto {EntityName.field} que se deja si no se resuelve.
+    """
+    segments = _COLLECTION_PATH_SEGMENTS.get(path_pattern)
+    if segments is None:
+        # split alterna literal, entidad, campo, literal, ... en una sola pasada
+        parts = ENTITY_PLACEHOLDER_PATTERN.split(path_pattern)
+        compiled = [
+            (
+                _split_field_placeholders(parts[i]),
+                parts[i + 1],
+                parts[i + 2],
+                _split_field_placeholders(f"{{{parts[i + 1]}.{parts[i + 2]}}}"),
+            )
+            for i in range(0, len(parts) - 1, 3)
+        ]
+        compiled.append((_split_field_placeholders(parts[-1]), None, None, None))
+        segments = _COLLECTION_PATH_SEGMENTS[path_pattern] = tuple(compiled)
+    return segments
+
+
+def _bind_root_placeholders(
+    segments: Tuple[Tuple[Any, ...], ...], root_entity: str, parent_instance: Any
+) -> Tuple[Tuple[Any, ...], ...]:
+    """
+    Resuelve de antemano los placeholders {RootEntity.field} de un pattern ya
+    troceado: salen de parent_instance, igual para todos los items de la collection.
+    
+    Los que no se resuelven se dejan para que se intenten por item como antes.
+    """
+    bound = []
+    for segment in segments:
+        literal_segments, entity_name, placeholder_field, _ = segment
+        if entity_name == root_entity and parent_instance:
+            value = getattr(parent_instance, placeholder_field, _MISSING)
+            if value is not _MISSING:
+                segment = (literal_segments + ((str(value), None),), None, None, None)
+        bound.append(segment)
+    return tuple(bound)
+
+
+def _append_field_placeholders(
+    parts: List[str],
+    segments: Tuple[Tuple[str, Optional[str]], ...],
+    field_value: Any,
+    field_name: str,
+    current_item: Any,
+) -> None:
+    """Añade a parts los segmentos resolviendo cada {field} con field_value o current_item"""
+    for literal, placeholder_field in segments:
+        parts.append(literal)
+        if placeholder_field is None:
+            continue
+        
+        # Si el placeholder coincide con el field actual, usar field_value directamente
+        if placeholder_field == field_name:
+            parts.append(str(field_value))
+            continue
+        
+        # Para otros campos, obtener del current_item; si no, se deja el placeholder
+        value = getattr(current_item, placeholder_field, _MISSING) if current_item else _MISSING
+        parts.append("{" + placeholder_field + "}" if value is _MISSING else str(value))
 
 
 # ===== MIXIN SERIALIZER REFACTORIZADO V2 =====
@@ -120,16 +365,50 @@ class MixinSerializer(BaseModel):
     Context estructura:
     {
         "schema": Dict,              # Schema completo del aggregate root
+        "field_meta": Dict,          # Schema compilado: entidad -> campo -> FieldMeta
+        "fields": Dict,              # FieldMeta especiales de current_entity (resuelto una vez)
         "ownership_path": List[str], # Stack: ["Store", "Product"]
         "current_entity": str,       # Entidad siendo serializada
         "is_collection_item": bool,  # Si está dentro de una collection owned
         "parent_path_resolver": str, # Path pattern del parent
+        "parent_path_segments": tuple, # Path pattern troceado con el root ya resuelto
         "parent_instance": obj,      # Instancia del parent para resolver placeholders
         "current_item": obj,         # Item actual para resolver placeholders
         "reference_field": str       # Campo que actúa como referencia de colección
     }
     """
 
+    # Schema core construido en el primer uso; las instancias anidadas ya
+    # validadas no se revalidan
+    model_config = ConfigDict(defer_build=True, revalidate_instances="never")
+
+    # Nombre del campo marcado con id() (None en Embeddables), resuelto por clase
+    __id_field__: ClassVar[Optional[str]] = None
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs: Any) -> None:
+        super().__pydantic_init_subclass__(**kwargs)
+        
+        # Subclase sin campos propios (marcadores, especializaciones): hereda
+        # el __id_field__ del padre en vez de recorrer de nuevo sus campos
+        model_fields = cls.model_fields
+        parent = cls.__mro__[1]
+        if (
+            issubclass(parent, MixinSerializer)
+            and not inspect.get_annotations(cls)
+            and model_fields.keys() == parent.model_fields.keys()
+        ):
+            return
+        
+        cls.__id_field__ = next(
+            (
+                field_name
+                for field_name, field_info in model_fields.items()
+                if _get_field_metadata(field_info).get("id")
+            ),
+            None,
+        )
+
     def model_dump_aggregate_root(self, mode: str = "python") -> Dict[str, Any]:
         """
         Serializa usando el schema de la entidad root con @entity decorator.
@@ -143,98 +422,113 @@ class MixinSerializer(BaseModel):
         Raises:
             ValueError: Si la clase no tiene @entity decorator
         """
-        if not hasattr(self.__class__, "__document_schema__"):
+        return self.model_dump(mode=mode, context=self._create_root_context())
+
+    def model_dump_aggregate_root_json(self) -> str:
+        """
+        Serializa a JSON usando el schema de la entidad root con @entity decorator.
+        
+        Equivale a json.dumps(model_dump_aggregate_root(mode="json")) pero el
+        encoding lo hace pydantic-core en una sola pasada, sin construir antes
+        el dict intermedio.
+        
+        Raises:
+            ValueError: Si la clase no tiene @entity decorator
+        """
+        return self.model_dump_json(context=self._create_root_context())
+
+    def _create_root_context(self) -> Dict[str, Any]:
+        """
+        Crea el context de serialización del aggregate root.
+        
+        Todo su contenido depende solo de la clase, así que se construye una
+        vez por clase (y por schema) y cada dump recibe una copia.
+        """
+        cls = self.__class__
+        if not hasattr(cls, "__document_schema__"):
             raise ValueError(
-                f"Class {self.__class__.__name__} debe usar @entity decorator "
+                f"Class {cls.__name__} debe usar @entity decorator "
                 f"para usar model_dump_aggregate_root(). "
                 f"Use model_dump() normal para objetos sin decorator."
             )
         
-        schema = self.__class__.__document_schema__
-        context = {
-            "schema": schema,
-            "ownership_path": [self.__class__.__name__],
-            "current_entity": self.__class__.__name__,
-            "is_collection_item": False,
-            "parent_path_resolver": None,
-            "parent_instance": None,
-            "current_item": None,
-            "reference_field": "id"
-        }
-        
-        return self.model_dump(mode=mode, context=context)
-
-    @field_serializer("*")
+        schema = cls.__document_schema__
+        cached = cls.__dict__.get("__root_context__")
+        if cached is None or cached[0] is not schema:
+            field_meta = cls._get_schema_field_meta()
+            cached = (schema, {
+                "schema": schema,
+                "field_meta": field_meta,
+                "fields": field_meta.get(cls.__name__, {}),
+                "ownership_path": [cls.__name__],
+                "current_entity": cls.__name__,
+                "is_collection_item": False,
+                "parent_path_resolver": None,
+                "parent_path_segments": None,
+                "parent_instance": None,
+                "current_item": None,
+                "reference_field": "id"
+            })
+            cls.__root_context__ = cached
+        return cached[1].copy()
+
+    # Los None explícitos los preserva pydantic-core sin llamar al serializer
+    @field_serializer("*", when_used="unless-none")
     def _serialize(self, value: Any, info: FieldSerializationInfo) -> Any:
         """Serialización basada en schema strategies con ownership tracking"""
         
-        # Preservar None explícitos
-        if value is None:
-            return None
+        # Los primitivos de campos sin estrategia se devuelven sin más llamadas:
+        # son la mayoría de los valores que pasan por aquí
+        context = info.context
+        if not context:
+            if type(value) in _PRIMITIVE_TYPES:
+                return value
+            return self._serialize_normal_field(value, info)
         
         field_name = info.field_name
         
         # NUEVO: Detectar si este campo es el reference_field de una collection
-        # Esto debe hacerse ANTES de obtener el field_schema
-        if info.context and info.context.get("is_collection_item", False):
-            reference_field = info.context.get("reference_field", "id")
+        # Esto debe hacerse ANTES de obtener el field_meta
+        if context.get("is_collection_item", False):
+            reference_field = context.get("reference_field", "id")
             if field_name == reference_field:
                 # Este campo actúa como referencia de colección
                 return self._serialize_collection_reference_field(value, info)
         
-        field_schema = self._get_field_schema(field_name, info.context)
+        # Los FieldMeta de la entidad actual se resuelven una sola vez al crear
+        # el context y solo contienen campos especiales: el resto sale aquí
+        fields = context.get("fields")
+        field_meta = fields.get(field_name) if fields else None
         
-        if not field_schema:
+        if field_meta is None:
+            if type(value) in _PRIMITIVE_TYPES:
+                return value
             return self._serialize_normal_field(value, info)
         
-        strategy = field_schema.get("strategy", "direct")
-        
         # Manejar collections/sets ANTES de las estrategias individuales
-        if isinstance(value, (list, set, tuple)) and strategy not in ["direct", "geopoint_value"]:
-            return self._serialize_collection_or_set(value, field_schema, info)
-        
-        # Estrategias para campos individuales
-        match strategy:
-            case "id_field":
-                return self._serialize_id_field(value, info)
-            case "geopoint_value":
-                return self._serialize_geopoint(value)
-            case "reference_path":
-                return self._serialize_reference(value, field_schema)
-            case "collection_with_paths":
-                return self._serialize_owned_collection(value, field_schema, info)
-            case "direct" | _:
-                return self._serialize_normal_field(value, info)
+        # (la estrategia ya decidió al compilar si aplica; solo entonces se mira el valor)
+        if field_meta.dispatch_iterables and isinstance(value, (list, set, tuple)):
+            return self._serialize_collection_or_set(value, field_meta, info)
+        
+        # Estrategias para campos individuales: handler resuelto al compilar
+        return field_meta.serializer(self, value, field_meta, info)
 
     # ==================== FIELD SCHEMA ====================
 
-    def _get_field_schema(
-        self, field_name: str, context: Optional[Dict] = None
-    ) -> Dict[str, Any]:
-        """
-        Obtiene schema del campo desde context.
-        
-        Busca en la entidad actual usando current_entity del context.
-        """
-        if not context or "schema" not in context:
-            return {}
-        
-        schema = context["schema"]
-        current_entity = context.get("current_entity")
-        
-        if not current_entity or current_entity not in schema:
-            return {}
-        
-        entity_schema = schema[current_entity]
-        if "properties" not in entity_schema:
-            return {}
-        
-        return entity_schema["properties"].get(field_name, {})
+    @classmethod
+    def _get_schema_field_meta(cls) -> Dict[str, Dict[str, FieldMeta]]:
+        """Compila __document_schema__ a FieldMeta una sola vez por clase"""
+        schema = cls.__document_schema__
+        cached = cls.__dict__.get("__schema_field_meta__")
+        if cached is None or cached[0] is not schema:
+            cached = (schema, _compile_schema(schema))
+            cls.__schema_field_meta__ = cached
+        return cached[1]
 
     # ==================== COLLECTION / SET SERIALIZERS ====================
 
     def _serialize_collection_or_set(
-        self, value: Any, field_schema: Dict[str, Any], info: FieldSerializationInfo
+        self, value: Any, field_meta: FieldMeta, info: FieldSerializationInfo
     ) -> List[Any]:
         """
         Serializa collections/sets distinguiendo entre:
@@ -242,11 +536,11 @@ class MixinSerializer(BaseModel):
         - Sets de Documents (no owned) → serializar completo
         - Arrays simples → serializar directo
         """
-        strategy = field_schema.get("strategy", "direct")
+        strategy = field_meta.strategy
         
         if strategy == "collection_with_paths":
             # Es una collection owned del aggregate root
-            return self._serialize_owned_collection(value, field_schema, info)
+            return self._serialize_owned_collection(value, field_meta, info)
         elif strategy == "direct" and self._is_document_set(value):
             # Es un Set de Documents NO owned (como tags en Product)
             return self._serialize_document_set(value, info)
@@ -255,7 +549,7 @@ class MixinSerializer(BaseModel):
             return self._serialize_normal_field(value, info)
 
     def _serialize_owned_collection(
-        self, value: Any, field_schema: Dict[str, Any], info: FieldSerializationInfo
+        self, value: Any, field_meta: FieldMeta, info: FieldSerializationInfo
     ) -> List[Dict]:
         """
         Serializa collections owned por el aggregate root.
@@ -272,37 +566,38 @@ class MixinSerializer(BaseModel):
         if not value:
             return []
         
-        collection_metadata = field_schema.get("collection_metadata", {})
-        path_pattern = collection_metadata.get("path_pattern", "")
-        reference_field = collection_metadata.get("reference_field", "id")
-        element_entity = collection_metadata.get("element_entity")
+        element_entity = field_meta.element_entity
+        parent_context = info.context
         
-        result = []
-        items = list(value) if isinstance(value, set) else value
+        # Context de los items owned: se crea una vez por entidad y cada item
+        # solo cambia current_item. Los items se serializan uno tras otro y
+        # nada retiene el context, así que se reutiliza sin copiarlo por item
+        contexts = {}
         
-        for item in items:
-            if not hasattr(item, "model_fields"):
+        def serialize_item(item: Any) -> Any:
+            if not isinstance(item, BaseModel):
                 # Item primitivo
-                result.append(item)
-                continue
+                return item
             
-            # Crear context para el item owned
-            item_context = self._create_child_context(
-                parent_context=info.context,
-                entity_name=element_entity or item.__class__.__name__,
-                is_collection_item=True,
-                path_pattern=path_pattern,
-                current_item=item,
-                reference_field=reference_field
-            )
+            entity_name = element_entity or item.__class__.__name__
+            item_context = contexts.get(entity_name)
+            if item_context is None:
+                item_context = contexts[entity_name] = self._create_child_context(
+                    parent_context=parent_context,
+                    entity_name=entity_name,
+                    is_collection_item=True,
+                    path_pattern=field_meta.path,
+                    reference_field=field_meta.reference_field
+                )
+            
+            item_context["current_item"] = item
             
             # Serializar el item COMPLETO usando su propio serializer
             # El campo indicado en reference_field se serializará como CollectionReference
-            item_data = item.model_dump(context=item_context)
-            
-            result.append(item_data)
+            return item.model_dump(context=item_context)
         
-        return result
+        # Los sets se recorren directamente: el orden es el mismo que daría list(value)
+        return [serialize_item(item) for item in value]
 
     def _serialize_document_set(
         self, value: Any, info: FieldSerializationInfo
@@ -318,10 +613,9 @@ class MixinSerializer(BaseModel):
             return []
         
         result = []
-        items = list(value) if isinstance(value, set) else value
         
-        for item in items:
-            if not hasattr(item, "model_fields"):
+        for item in value:
+            if not isinstance(item, BaseModel):
                 result.append(item)
                 continue
             
@@ -366,7 +660,7 @@ class MixinSerializer(BaseModel):
         return CollectionReference(path=resolved_path)
 
     def _serialize_id_field(
-        self, value: Any, info: FieldSerializationInfo
+        self, value: Any, field_meta: FieldMeta, info: FieldSerializationInfo
     ) -> Union[DocumentId, CollectionReference, str]:
         """
         Serializa el campo 'id' como DocumentId, CollectionReference o UUID según el contexto.
@@ -376,20 +670,13 @@ class MixinSerializer(BaseModel):
         2. Si is_collection_item=True Y reference_field!='id' → UUID simple (otro campo es la referencia)
         3. Si es root document → DocumentId
         4. Otherwise → string
-        """
-        if not info.context:
-            return str(value)
         
-        schema = info.context.get("schema", {})
-        current_entity = info.context.get("current_entity")
+        El FieldMeta viene de la entidad actual del context, así que el
+        collection_name del document ya está resuelto en field_meta.path.
+        """
         is_collection_item = info.context.get("is_collection_item", False)
         reference_field = info.context.get("reference_field", "id")
         
-        if not current_entity or current_entity not in schema:
-            return str(value)
-        
-        entity_metadata = schema[current_entity].get("entity_metadata", {})
-        
         # Caso 1: Es item de una collection owned
         if is_collection_item:
             # Si reference_field es 'id', entonces 'id' se serializa como CollectionReference
@@ -409,14 +696,13 @@ class MixinSerializer(BaseModel):
                 return str(value)
         
         # Caso 2: Root document o document independiente
-        if entity_metadata.get("type") == "document" and entity_metadata.get("collection_name"):
-            collection_name = entity_metadata["collection_name"]
-            return DocumentId(path=f"{collection_name}/{str(value)}")
+        if field_meta.path:
+            return DocumentId(path=f"{field_meta.path}/{str(value)}")
         
         return str(value)
 
     def _serialize_reference(
-        self, value: Any, field_schema: Dict[str, Any]
+        self, value: Any, field_meta: FieldMeta, info: Optional[FieldSerializationInfo] = None
     ) -> Optional[Dict[str, str]]:
         """
         Serializa reference retornando SOLO el path.
@@ -428,11 +714,8 @@ class MixinSerializer(BaseModel):
         if value is None:
             return None
         
-        reference_metadata = field_schema.get("reference_metadata", {})
-        path_resolver = reference_metadata.get("path_resolver", "")
-        
-        # Resolver path usando placeholders
-        resolved_path = self._resolve_path_placeholders(path_resolver, value)
+        # Resolver path con el path_resolver precompilado
+        resolved_path = field_meta.resolver(value)
         
         # Retornar SOLO el path (no más campos del objeto referenciado)
         return {"path": resolved_path}
@@ -442,6 +725,10 @@ class MixinSerializer(BaseModel):
         if value is None:
             return None
         
+        # Ya es GeoPointValue (lo habitual): se devuelve sin construir otro
+        if type(value) is GeoPointValue:
+            return value
+        
         if isinstance(value, (tuple, list)) and len(value) == 2:
             latitude, longitude = value
             return GeoPointValue(latitude=float(latitude), longitude=float(longitude))
@@ -460,15 +747,24 @@ class MixinSerializer(BaseModel):
 
     def _serialize_normal_field(self, value: Any, info: FieldSerializationInfo) -> Any:
         """Serializa campos normales sin metadata especial"""
+        value_type = type(value)
+        if value_type in _PRIMITIVE_TYPES:
+            return value
+        
+        # Contenedores exactos por identidad de tipo, luego modelos anidados;
+        # el isinstance con la tupla queda solo para subclases de contenedores
+        if value_type in _ITERABLE_TYPES:
+            return self._serialize_iterable_field(value)
+        if isinstance(value, BaseModel):
+            return value.model_dump()
         if isinstance(value, (list, tuple, set)):
             return self._serialize_iterable_field(value)
-        else:
-            return self._serialize_single_item(value)
+        return value
 
     # ==================== PATH RESOLVERS ====================
 
     def _resolve_collection_field_path(
-        self, path_pattern: str, field_value: Any, field_name: str, context: Dict
+        self, path_pattern: str, field_value: Any, field_name: str, context: Dict[str, Any]
     ) -> str:
         """
         Resuelve el path completo para un campo de collection (puede ser 'id' o 'name').
@@ -488,113 +784,73 @@ class MixinSerializer(BaseModel):
         Pattern: "categories/{name}"
         Context: current_entity="Category", field_value="Electronics"
         Result:  "categories/Electronics"
-        """
-        resolved = path_pattern
         
+        El pattern se trocea una sola vez (_compile_collection_path) y el context
+        de la collection ya trae resueltos los placeholders del root; por item
+        solo se leen los valores restantes y se concatenan.
+        """
         ownership_path = context.get("ownership_path", [])
         current_entity = context.get("current_entity")
         parent_instance = context.get("parent_instance")
         current_item = context.get("current_item")
         
-        # Paso 1: Resolver placeholders CON entidad {EntityName.field}
-        pattern_with_entity = re.compile(r"\{([^.]+)\.([^}]+)\}")
+        segments = context.get("parent_path_segments")
+        if segments is None or context.get("parent_path_resolver") != path_pattern:
+            segments = _compile_collection_path(path_pattern)
         
-        def replace_with_entity(match):
-            entity_name = match.group(1)
-            placeholder_field = match.group(2)
+        parts = []
+        for literal_segments, entity_name, placeholder_field, placeholder_segments in segments:
+            # Placeholders SIN entidad {field}: current_item o field_value
+            _append_field_placeholders(
+                parts, literal_segments, field_value, field_name, current_item
+            )
+            if entity_name is None:
+                continue
+            
+            # Placeholders CON entidad {EntityName.field}
+            value = _MISSING
             
             # Caso 1: Es el root entity (Store)
             if entity_name == ownership_path[0]:
-                if parent_instance and hasattr(parent_instance, placeholder_field):
-                    value = getattr(parent_instance, placeholder_field)
-                    return str(value)
+                if parent_instance:
+                    value = getattr(parent_instance, placeholder_field, _MISSING)
             
             # Caso 2: Es la entidad actual (Product, Category, etc.)
             elif entity_name == current_entity:
                 # Si el placeholder coincide con el field actual, usar field_value
                 if placeholder_field == field_name:
-                    return str(field_value)
+                    value = field_value
                 # Sino, obtener del current_item
-                elif current_item and hasattr(current_item, placeholder_field):
-                    value = getattr(current_item, placeholder_field)
-                    return str(value)
-            
-            return match.group(0)  # No reemplazar si no encontramos
-        
-        resolved = pattern_with_entity.sub(replace_with_entity, resolved)
-        
-        # Paso 2: Resolver placeholders SIN entidad {field}
-        # Estos asumen la entidad actual y usan current_item o field_value
-        pattern_without_entity = re.compile(r"\{([^.}]+)\}")
-        
-        def replace_without_entity(match):
-            placeholder_field = match.group(1)
-            
-            # Si el placeholder coincide con el field actual, usar field_value directamente
-            if placeholder_field == field_name:
-                return str(field_value)
+                elif current_item:
+                    value = getattr(current_item, placeholder_field, _MISSING)
             
-            # Para otros campos, obtener del current_item
-            if current_item and hasattr(current_item, placeholder_field):
-                value = getattr(current_item, placeholder_field)
-                return str(value)
-            
-            # No pudimos resolver
-            return match.group(0)
-        
-        resolved = pattern_without_entity.sub(replace_without_entity, resolved)
-        
-        return resolved
-
-    def _resolve_path_placeholders(
-        self, path_pattern: str, referenced_item: Any
-    ) -> str:
-        """
-        Resuelve placeholders en reference paths.
-        
-        Ejemplo:
-        Pattern: "categories/{Category.id}"
-        Item:    Category(id=123, ...)
-        Result:  "categories/123"
-        """
-        if not path_pattern:
-            return ""
-        
-        resolved = path_pattern
-        
-        # Pattern: {EntityName.field}
-        placeholder_pattern = re.compile(r"\{([^.]+)\.([^}]+)\}")
-        
-        def replace_placeholder(match):
-            entity_name = match.group(1)
-            field_name = match.group(2)
-            
-            # El valor viene del objeto referenciado
-            if hasattr(referenced_item, field_name):
-                field_value = getattr(referenced_item, field_name)
-                return str(field_value)
-            
-            return match.group(0)
+            if value is _MISSING:
+                # No se reemplaza; solo se resuelven los {field} que contenga
+                _append_field_placeholders(
+                    parts, placeholder_segments, field_value, field_name, current_item
+                )
+            else:
+                parts.append(str(value))
         
-        resolved = placeholder_pattern.sub(replace_placeholder, resolved)
-        return resolved
+        return "".join(parts)
 
     # ==================== CONTEXT HELPERS ====================
 
     def _create_child_context(
         self,
-        parent_context: Dict,
+        parent_context: Dict[str, Any],
         entity_name: str,
         is_collection_item: bool,
         path_pattern: Optional[str] = None,
         current_item: Optional[Any] = None,
         reference_field: str = "id"
-    ) -> Dict:
+    ) -> Dict[str, Any]:
         """
         Crea un context para serializar entidades hijas.
         
         Propaga:
         - schema completo
+        - FieldMeta compilados (y los de la entidad hija ya resueltos)
         - ownership_path actualizado
         - información de collection_item
         - path_pattern para resolver IDs
@@ -604,13 +860,24 @@ class MixinSerializer(BaseModel):
         """
         ownership_path = parent_context.get("ownership_path", []).copy()
         ownership_path.append(entity_name)
+        field_meta = parent_context.get("field_meta") or {}
+        
+        # Los placeholders del root no cambian entre items: se resuelven aquí
+        path_segments = None
+        if path_pattern:
+            path_segments = _bind_root_placeholders(
+                _compile_collection_path(path_pattern), ownership_path[0], self
+            )
         
         return {
             "schema": parent_context.get("schema"),
+            "field_meta": field_meta,
+            "fields": field_meta.get(entity_name, {}),
             "ownership_path": ownership_path,
             "current_entity": entity_name,
             "is_collection_item": is_collection_item,
             "parent_path_resolver": path_pattern,
+            "parent_path_segments": path_segments,
             "parent_instance": self,  # Para resolver {Store.id} en placeholders
             "current_item": current_item,
             "reference_field": reference_field
@@ -624,7 +891,7 @@ class MixinSerializer(BaseModel):
         
         Criterios:
         - Es list/set/tuple
-        - Los items tienen model_fields (son Pydantic models)
+        - Los items son modelos Pydantic (BaseModel)
         - Los items tienen atributo 'id' (son Documents)
         """
         if not isinstance(value, (list, set, tuple)) or not value:
@@ -632,44 +899,64 @@ class MixinSerializer(BaseModel):
         
         first_item = next(iter(value))
         
-        return (
-            hasattr(first_item, "model_fields") and 
-            hasattr(first_item, "id")
-        )
+        return isinstance(first_item, BaseModel) and hasattr(first_item, "id")
 
     # ==================== ITERABLE HELPERS ====================
 
     def _serialize_iterable_field(self, value: Any) -> List[Any]:
         """Serializa campos iterables normales (arrays simples)"""
-        if isinstance(value, set):
-            iterable = list(value)
-        else:
-            iterable = value
+        # Lista de primitivos: se devuelve tal cual (pydantic-core ya copia el
+        # resultado al serializarlo), evitando una lista nueva por campo
+        if type(value) is list:
+            for item in value:
+                if type(item) not in _PRIMITIVE_TYPES:
+                    break
+            else:
+                return value
         
-        return [self._serialize_single_item(item) for item in iterable]
+        return [self._serialize_single_item(item) for item in value]
 
     def _serialize_single_item(self, item: Any) -> Any:
         """Serializa un item individual"""
-        if not hasattr(item, "__dict__"):
-            return item
-        
-        # Para objetos con model_fields pero sin schema (@entity)
-        if hasattr(item, "model_fields"):
+        # Para modelos Pydantic sin schema (@entity)
+        if isinstance(item, BaseModel):
             return item.model_dump()
         
         return item
 
 
+def _serialize_as_geopoint(
+    instance: MixinSerializer, value: Any, field_meta: FieldMeta, info: FieldSerializationInfo
+) -> Optional[GeoPointValue]:
+    return instance._serialize_geopoint(value)
+
+
+def _serialize_as_normal_field(
+    instance: MixinSerializer, value: Any, field_meta: FieldMeta, info: FieldSerializationInfo
+) -> Any:
+    return instance._serialize_normal_field(value, info)
+
+
+# Tabla de dispatch por estrategia; las no listadas ("direct" o desconocidas)
+# se serializan como campo normal
+_STRATEGY_SERIALIZERS: Dict[str, Callable[..., Any]] = {
+    "id_field": MixinSerializer._serialize_id_field,
+    "geopoint_value": _serialize_as_geopoint,
+    "reference_path": MixinSerializer._serialize_reference,
+    "collection_with_paths": MixinSerializer._serialize_owned_collection,
+}
+
+
 # ===== CLASES PRINCIPALES =====
 
 
 class Document(MixinSerializer):
     id: UUID = id()
 
-    def __eq__(self, value):
-        return isinstance(value, Document) and value.id == self.id
+    def __eq__(self, value: Any) -> bool:
+        return self is value or (isinstance(value, Document) and value.id == self.id)
 
-    def __hash__(self):
+    def __hash__(self) -> int:
         return hash(self.id)
 
 
@@ -1,16 +1,40 @@
 from typing import Any, Dict, List, Optional, Set, get_args, get_origin, Union, Type
 from pydantic import BaseModel
 from common.inflect import plural
-from .document import Document
+from .document import Document, MixinSerializer, _get_field_metadata
 from enum import Enum
-import inspect
+from functools import lru_cache
 import re
+import sys
+import weakref
 
 # ==================== CONSTANTS ====================
 
 PLACEHOLDER_PATTERN = re.compile(r"\{([^}]+)\}")
 
 
+def _scan_placeholders(pattern: str) -> List[str]:
+    """
+    Extrae los placeholders {xxx} de un pattern con str.find.
+
+    Equivale a PLACEHOLDER_PATTERN.findall(pattern) sin pasar por el motor de
+    regex: los patterns son cortos y tienen uno o dos placeholders.
+    """
+    placeholders = []
+    start = pattern.find("{")
+    while start != -1:
+        end = pattern.find("}", start + 1)
+        if end == -1:
+            break
+        if end == start + 1:
+            # "{}" no es placeholder
+            start = pattern.find("{", start + 1)
+            continue
+        placeholders.append(pattern[start + 1 : end])
+        start = pattern.find("{", end + 1)
+    return placeholders
+
+
 class FieldTypes:
     ID = "id"
     GEOPOINT = "geopoint"
@@ -100,76 +124,192 @@ PRIMITIVE_TYPES = frozenset({str, int, float, bool})
 EXCLUDED_METADATA_KEYS = frozenset({"string", "integer", "number", "boolean"})
 CONTAINER_TYPES = frozenset({list, set, tuple})
 
+# Tablas de dispatch: un lookup en lugar de cadenas de match/case
+ORIGIN_CATEGORIES = {
+    set: FieldCategories.SET,
+    list: FieldCategories.LIST,
+    tuple: FieldCategories.TUPLE,
+}
+DIRECT_CATEGORY_FIELD_TYPES = {
+    FieldCategories.PRIMITIVE: FieldTypes.PRIMITIVE,
+    FieldCategories.ENUM: FieldTypes.ENUM,
+    FieldCategories.EMBEDDED: FieldTypes.EMBEDDED,
+}
+TARGET_ENTITY_KEYS = {
+    FieldTypes.REFERENCE: (SchemaKeys.REFERENCE_METADATA, SchemaKeys.TARGET_ENTITY),
+    FieldTypes.COLLECTION: (SchemaKeys.COLLECTION_METADATA, SchemaKeys.ELEMENT_ENTITY),
+}
+ARRAY_FIELD_TYPES = frozenset({FieldTypes.OBJECT_ARRAY, FieldTypes.SET})
+
+
+# Pares (nombre, FieldInfo) de model_fields, por clase
+_FIELD_ITEMS_CACHE: "weakref.WeakKeyDictionary[Type[BaseModel], tuple]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _model_field_items(model_class: Type[BaseModel]) -> tuple:
+    """Snapshot en tupla de model_fields.items(), calculado una vez por clase"""
+    items = _FIELD_ITEMS_CACHE.get(model_class)
+    if items is None:
+        items = _FIELD_ITEMS_CACHE[model_class] = tuple(
+            model_class.model_fields.items()
+        )
+    return items
+
+
+# Campo ID de los modelos que no son MixinSerializer, por clase ("" si no tienen)
+_ID_FIELD_CACHE: "weakref.WeakKeyDictionary[Type[BaseModel], str]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _id_field_name(model_class: Type[BaseModel]) -> Optional[str]:
+    """Nombre del campo marcado con id(), resuelto una sola vez por clase"""
+    if issubclass(model_class, MixinSerializer):
+        return model_class.__id_field__
+
+    id_field = _ID_FIELD_CACHE.get(model_class)
+    if id_field is None:
+        id_field = _ID_FIELD_CACHE[model_class] = next(
+            (
+                field_name
+                for field_name, field_info in _model_field_items(model_class)
+                if _get_field_metadata(field_info).get(MetadataKeys.ID)
+            ),
+            "",
+        )
+    return id_field or None
+
+
+def _is_document_model(model_class: Type[BaseModel]) -> bool:
+    """Verifica si tiene campo ID (es Document)"""
+    return _id_field_name(model_class) is not None
+
+
 # ==================== SCHEMA BUILDERS (FIXED) ====================
 
 
+# Schemas de campo constantes, uno compartido por combinación (el schema
+# generado es de solo lectura)
+_CONSTANT_SCHEMAS: Dict[tuple, Dict[str, str]] = {}
+
+
+# Schemas de reference/collection compartidos por (entidad, path[, campo]):
+# muchos campos apuntan al mismo target con el mismo path
+_REFERENCE_SCHEMAS: Dict[tuple, Dict[str, Any]] = {}
+_COLLECTION_SCHEMAS: Dict[tuple, Dict[str, Any]] = {}
+
+
+def _constant_schema(*items: tuple) -> Dict[str, str]:
+    """Devuelve el dict compartido para estos pares (clave, valor)"""
+    shared = _CONSTANT_SCHEMAS.get(items)
+    if shared is None:
+        shared = _CONSTANT_SCHEMAS[items] = dict(items)
+    return shared
+
+
+@lru_cache(maxsize=None)
+def _plural_lower(name: str) -> str:
+    """Nombre de colección de una entidad: plural(name.lower()) cacheado"""
+    return sys.intern(plural(name.lower()))
+
+
+@lru_cache(maxsize=None)
+def _default_reference_path(target_entity: str) -> str:
+    """Path resolver por defecto de un reference(): coleccion/{Entidad.id}"""
+    return f"{_plural_lower(target_entity)}/{{{target_entity}.{PlaceholderKeys.ID}}}"
+
+
+@lru_cache(maxsize=None)
+def _default_collection_path(
+    parent_entity: str, element_entity: str, field_name: str
+) -> str:
+    """Path pattern por defecto de un collection() sin nombre explícito"""
+    return (
+        f"{_plural_lower(parent_entity)}/{{{parent_entity}.{PlaceholderKeys.ID}}}"
+        f"/{field_name}/{{{element_entity}.{PlaceholderKeys.ID}}}"
+    )
+
+
 class SchemaBuilder:
     """Factory para construcción de schemas - LIMPIO como Schema.json esperado"""
 
     @staticmethod
     def build_basic_schema(field_type: str, strategy: str) -> Dict[str, str]:
-        return {SchemaKeys.TYPE: field_type, SchemaKeys.STRATEGY: strategy}
+        return _constant_schema(
+            (SchemaKeys.TYPE, field_type), (SchemaKeys.STRATEGY, strategy)
+        )
 
     @staticmethod
     def build_geppoint_schema(field_type: str, strategy: str) -> Dict[str, str]:
-        return {
-            SchemaKeys.TYPE: field_type,
-            SchemaKeys.STRATEGY: strategy,
-            SchemaKeys.DIFF_STRATEGY: DiffStrategies.BY_OBJECT_EQUALITY,
-        }
+        return _constant_schema(
+            (SchemaKeys.TYPE, field_type),
+            (SchemaKeys.STRATEGY, strategy),
+            (SchemaKeys.DIFF_STRATEGY, DiffStrategies.BY_OBJECT_EQUALITY),
+        )
 
     @staticmethod
     def build_reference_schema(
         target_entity: str, path_resolver: str
     ) -> Dict[str, Any]:
-        return {
-            SchemaKeys.TYPE: FieldTypes.REFERENCE,
-            SchemaKeys.STRATEGY: Strategies.REFERENCE_PATH,
-            SchemaKeys.DIFF_STRATEGY: DiffStrategies.BY_OBJECT_EQUALITY,  # ← AÑADIR
-            SchemaKeys.REFERENCE_METADATA: {
-                SchemaKeys.TARGET_ENTITY: target_entity,
-                SchemaKeys.PATH_RESOLVER: path_resolver,
-            },
-        }
+        key = (target_entity, path_resolver)
+        shared = _REFERENCE_SCHEMAS.get(key)
+        if shared is None:
+            shared = _REFERENCE_SCHEMAS[key] = {
+                SchemaKeys.TYPE: FieldTypes.REFERENCE,
+                SchemaKeys.STRATEGY: Strategies.REFERENCE_PATH,
+                SchemaKeys.DIFF_STRATEGY: DiffStrategies.BY_OBJECT_EQUALITY,  # ← AÑADIR
+                SchemaKeys.REFERENCE_METADATA: {
+                    SchemaKeys.TARGET_ENTITY: target_entity,
+                    SchemaKeys.PATH_RESOLVER: path_resolver,
+                },
+            }
+        return shared
 
     @staticmethod
     def build_collection_schema(
         element_entity: str, path_pattern: str, reference_field: str
     ) -> Dict[str, Any]:
-        return {
-            SchemaKeys.TYPE: FieldTypes.COLLECTION,
-            SchemaKeys.STRATEGY: Strategies.COLLECTION_WITH_PATHS,
-            SchemaKeys.DIFF_STRATEGY: DiffStrategies.BY_OBJECT_EQUALITY,  # ← AÑADIR
-            SchemaKeys.COLLECTION_METADATA: {
-                SchemaKeys.ELEMENT_ENTITY: element_entity,
-                SchemaKeys.PATH_PATTERN: path_pattern,
-                SchemaKeys.REFERENCE_field: reference_field,
-            },
-        }
+        key = (element_entity, path_pattern, reference_field)
+        shared = _COLLECTION_SCHEMAS.get(key)
+        if shared is None:
+            shared = _COLLECTION_SCHEMAS[key] = {
+                SchemaKeys.TYPE: FieldTypes.COLLECTION,
+                SchemaKeys.STRATEGY: Strategies.COLLECTION_WITH_PATHS,
+                SchemaKeys.DIFF_STRATEGY: DiffStrategies.BY_OBJECT_EQUALITY,  # ← AÑADIR
+                SchemaKeys.COLLECTION_METADATA: {
+                    SchemaKeys.ELEMENT_ENTITY: element_entity,
+                    SchemaKeys.PATH_PATTERN: path_pattern,
+                    SchemaKeys.REFERENCE_field: reference_field,
+                },
+            }
+        return shared
 
     @staticmethod
     def build_simple_array_schema(field_type: str) -> Dict[str, Any]:
         """✅ FIXED: simple_array con strategy 'direct' y sin array_metadata"""
-        return {SchemaKeys.TYPE: field_type, SchemaKeys.STRATEGY: Strategies.DIRECT}
+        return _constant_schema(
+            (SchemaKeys.TYPE, field_type), (SchemaKeys.STRATEGY, Strategies.DIRECT)
+        )
 
     @staticmethod
     def build_tuple_schema() -> Dict[str, Any]:
         """✅ FIXED: tuple con strategy 'direct' y sin array_metadata"""
-        return {
-            SchemaKeys.TYPE: FieldTypes.TUPLE,
-            SchemaKeys.STRATEGY: Strategies.DIRECT,
-        }
+        return _constant_schema(
+            (SchemaKeys.TYPE, FieldTypes.TUPLE), (SchemaKeys.STRATEGY, Strategies.DIRECT)
+        )
 
     @staticmethod
     def build_complex_array_schema(
         field_type: str, element_type: str, diff_strategy: str
     ) -> Dict[str, Any]:
         """Para object_array y set que NO necesitan metadata"""
-        return {
-            SchemaKeys.TYPE: field_type,
-            SchemaKeys.STRATEGY: Strategies.DIRECT,
-            SchemaKeys.DIFF_STRATEGY: diff_strategy,
-        }
+        return _constant_schema(
+            (SchemaKeys.TYPE, field_type),
+            (SchemaKeys.STRATEGY, Strategies.DIRECT),
+            (SchemaKeys.DIFF_STRATEGY, diff_strategy),
+        )
 
     @staticmethod
     def build_entity_schema(
@@ -187,6 +327,8 @@ class SchemaBuilder:
 class FieldProcessor:
     """Procesador de campos con validaciones robustas"""
 
+    __slots__ = ("all_models",)
+
     def __init__(self, all_models: Dict[str, Type[BaseModel]]):
         self.all_models = all_models
 
@@ -203,7 +345,7 @@ class FieldProcessor:
                 collection_name, target_entity, target_type
             )
         else:
-            path_resolver = f"{plural(target_entity.lower())}/{{{target_entity}.{PlaceholderKeys.ID}}}"
+            path_resolver = _default_reference_path(target_entity)
 
         return SchemaBuilder.build_reference_schema(target_entity, path_resolver)
 
@@ -216,15 +358,18 @@ class FieldProcessor:
         collection_name = metadata.get("collection_name")
 
         if collection_name:
-            self._validate_collection_placeholders(collection_name, element_type)
+            placeholders = _scan_placeholders(collection_name)
+            self._validate_collection_placeholders(
+                collection_name, element_type, placeholders
+            )
             path_pattern = self._build_collection_path(
                 collection_name, element_entity, element_type, current_entity
             )
-            reference_field = self._determine_reference_field(
-                PLACEHOLDER_PATTERN.findall(collection_name)
-            )
+            reference_field = self._determine_reference_field(placeholders)
         else:
-            path_pattern = f"{plural(current_entity.lower())}/{{{current_entity}.{PlaceholderKeys.ID}}}/{field_name}/{{{element_entity}.{PlaceholderKeys.ID}}}"
+            path_pattern = _default_collection_path(
+                current_entity, element_entity, field_name
+            )
             reference_field = PlaceholderKeys.ID
 
         return SchemaBuilder.build_collection_schema(
@@ -232,11 +377,9 @@ class FieldProcessor:
         )
 
     def _validate_collection_placeholders(
-        self, collection_name: str, element_type: Type
+        self, collection_name: str, element_type: Type, placeholders: List[str]
     ):
         """Valida placeholders según si es Document o Embeddable"""
-        placeholders = PLACEHOLDER_PATTERN.findall(collection_name)
-
         for placeholder in placeholders:
             if placeholder == PlaceholderKeys.ID and not self._is_document_type(
                 element_type
@@ -253,15 +396,9 @@ class FieldProcessor:
         self, placeholder: str, element_type: Type, collection_name: str
     ):
         """Valida que un campo existe en el tipo"""
-        if (
-            not hasattr(element_type, "model_fields")
-            or placeholder not in element_type.model_fields
-        ):
-            available_fields = (
-                list(element_type.model_fields.keys())
-                if hasattr(element_type, "model_fields")
-                else []
-            )
+        model_fields = getattr(element_type, "model_fields", None)
+        if model_fields is None or placeholder not in model_fields:
+            available_fields = list(model_fields.keys()) if model_fields else []
             raise ValueError(
                 f"Placeholder '{{{placeholder}}}' en collection(\"{collection_name}\") "
                 f"no existe en {element_type.__name__}. "
@@ -276,60 +413,47 @@ class FieldProcessor:
         parent_entity: str,
     ) -> str:
         """Construye path de collection con validación"""
-        parent_collection = plural(parent_entity.lower())
+        resolved_pattern = self._resolve_path_pattern(
+            collection_name, element_entity, element_type
+        )
+        if collection_name.startswith(_plural_lower(parent_entity)):
+            return resolved_pattern
 
-        if not collection_name.startswith(parent_collection):
-            resolved_pattern = self._resolve_path_pattern(
-                collection_name, element_entity, element_type
-            )
-            return f"{parent_collection}/{{{parent_entity}.id}}/{resolved_pattern}"
-        else:
-            return self._resolve_path_pattern(
-                collection_name, element_entity, element_type
-            )
+        # Prefijo del padre: coleccion/{Padre.id}, el mismo que su reference por defecto
+        return f"{_default_reference_path(parent_entity)}/{resolved_pattern}"
 
     def _resolve_path_pattern(
         self, pattern: str, target_entity: str, target_type: Type
     ) -> str:
         """Resuelve placeholders con validación robusta"""
-        if "." in pattern:
+        # Ya cualificado, o sin placeholders: nada que resolver ni validar
+        if "." in pattern or "{" not in pattern:
             return pattern
 
-        resolved = pattern
-        placeholders = PLACEHOLDER_PATTERN.findall(pattern)
-
-        for placeholder in placeholders:
-            match placeholder:
-                case "id":
-                    if not self._is_document_type(target_type):
-                        raise ValueError(
-                            f"Placeholder '{{id}}' usado para {target_entity} que es Embeddable. "
-                            f"Los Embeddables no tienen campo id."
-                        )
-                    resolved = resolved.replace("{id}", f"{{{target_entity}.id}}")
-                case _:
-                    self._validate_placeholder_field(
-                        placeholder, target_type, target_entity
-                    )
-                    resolved = resolved.replace(
-                        f"{{{placeholder}}}", f"{{{target_entity}.{placeholder}}}"
+        def qualify(match: re.Match) -> str:
+            # Cada placeholder se valida y se cualifica con la entidad en la misma pasada
+            placeholder = match.group(1)
+            if placeholder == PlaceholderKeys.ID:
+                if not self._is_document_type(target_type):
+                    raise ValueError(
+                        f"Placeholder '{{id}}' usado para {target_entity} que es Embeddable. "
+                        f"Los Embeddables no tienen campo id."
                     )
+            else:
+                self._validate_placeholder_field(
+                    placeholder, target_type, target_entity
+                )
+            return f"{{{target_entity}.{placeholder}}}"
 
-        return resolved
+        return PLACEHOLDER_PATTERN.sub(qualify, pattern)
 
     def _validate_placeholder_field(
         self, placeholder: str, target_type: Type, target_entity: str
     ):
         """Valida que un placeholder existe como campo"""
-        if (
-            not hasattr(target_type, "model_fields")
-            or placeholder not in target_type.model_fields
-        ):
-            available_fields = (
-                list(target_type.model_fields.keys())
-                if hasattr(target_type, "model_fields")
-                else []
-            )
+        model_fields = getattr(target_type, "model_fields", None)
+        if model_fields is None or placeholder not in model_fields:
+            available_fields = list(model_fields.keys()) if model_fields else []
             raise ValueError(
                 f"Placeholder '{{{placeholder}}}' no existe en {target_entity}. "
                 f"Campos disponibles: {available_fields}"
@@ -337,58 +461,95 @@ class FieldProcessor:
 
     def _determine_reference_field(self, placeholders: List[str]) -> str:
         """Determina campo de referencia evitando 'id' si no existe"""
-        non_id_placeholders = [p for p in placeholders if p != PlaceholderKeys.ID]
-        return non_id_placeholders[0] if non_id_placeholders else PlaceholderKeys.ID
+        for placeholder in placeholders:
+            if placeholder != PlaceholderKeys.ID:
+                return placeholder
+        return PlaceholderKeys.ID
 
     def _is_document_type(self, model_class: Type[BaseModel]) -> bool:
         """Verifica si tiene campo ID (es Document) con búsqueda optimizada"""
         if not hasattr(model_class, "model_fields"):
             return False
 
-        return any(
-            self._extract_field_metadata(field_info).get(MetadataKeys.ID, False)
-            for field_info in model_class.model_fields.values()
-        )
-
-    def _extract_field_metadata(self, field_info) -> Dict[str, Any]:
-        """Extrae metadata de FieldInfo"""
-        if (
-            not hasattr(field_info, "json_schema_extra")
-            or not field_info.json_schema_extra
-        ):
-            return {}
-        return field_info.json_schema_extra.get("metadata", {})
+        return _is_document_model(model_class)
 
     def _extract_base_type(self, annotation):
         """Extrae tipo base manejando Optional"""
-        origin = get_origin(annotation)
-        if origin is Union:
-            args = get_args(annotation)
-            non_none_types = [arg for arg in args if arg is not type(None)]
-            return (
-                self._extract_base_type(non_none_types[0])
-                if non_none_types
-                else annotation
-            )
-        else:
+        # Clases planas (str, int, modelos): sin pasar por typing
+        if getattr(annotation, "__origin__", None) is None:
             return annotation
+        return _generic_base_type(annotation)
 
     def _extract_list_element_type(self, annotation):
         """Extrae tipo de elemento de contenedores"""
-        origin = get_origin(annotation)
-        if origin is Union:
-            args = get_args(annotation)
-            non_none_args = [arg for arg in args if arg is not type(None)]
-            return (
-                self._extract_list_element_type(non_none_args[0])
-                if non_none_args
-                else None
-            )
-        elif origin in CONTAINER_TYPES:
-            args = get_args(annotation)
-            return args[0] if args else None
-        else:
+        if getattr(annotation, "__origin__", None) is None:
+            return None
+        return _generic_element_type(annotation)
+
+
+@lru_cache(maxsize=1024)
+def _generic_base_type(annotation):
+    """Tipo base de una anotación genérica (Optional[X] -> X)"""
+    origin = get_origin(annotation)
+    if origin is Union:
+        args = get_args(annotation)
+        non_none_types = [arg for arg in args if arg is not type(None)]
+        if not non_none_types:
+            return annotation
+        base = non_none_types[0]
+        if getattr(base, "__origin__", None) is None:
+            return base
+        return _generic_base_type(base)
+    else:
+        return annotation
+
+
+@lru_cache(maxsize=1024)
+def _generic_element_type(annotation):
+    """Tipo de elemento de una anotación genérica de contenedor"""
+    origin = get_origin(annotation)
+    if origin is Union:
+        args = get_args(annotation)
+        non_none_args = [arg for arg in args if arg is not type(None)]
+        if not non_none_args or getattr(non_none_args[0], "__origin__", None) is None:
             return None
+        return _generic_element_type(non_none_args[0])
+    elif origin in CONTAINER_TYPES:
+        args = get_args(annotation)
+        return args[0] if args else None
+    else:
+        return None
+
+
+@lru_cache(maxsize=1024)
+def _generic_related_models(annotation) -> tuple:
+    """Modelos Pydantic dentro de una anotación genérica (Union / contenedor)"""
+    models = []
+    origin = get_origin(annotation)
+
+    if origin is Union:
+        for arg in get_args(annotation):
+            if arg is not type(None):
+                models.extend(_related_models(arg))
+    elif origin in CONTAINER_TYPES:
+        args = get_args(annotation)
+        if args:
+            models.extend(_related_models(args[0]))
+    else:
+        if TypeAnalyzer.is_pydantic_model(annotation):
+            models.append(annotation)
+
+    return tuple(models)
+
+
+def _related_models(annotation) -> tuple:
+    """Modelos relacionados de una anotación; las genéricas se cachean"""
+    # str/int/float/bool: la mayoría de campos, sin más comprobaciones
+    if annotation in PRIMITIVE_TYPES:
+        return ()
+    if getattr(annotation, "__origin__", None) is None:
+        return (annotation,) if TypeAnalyzer.is_pydantic_model(annotation) else ()
+    return _generic_related_models(annotation)
 
 
 # ==================== TYPE ANALYZER (FIXED) ====================
@@ -400,32 +561,19 @@ class TypeAnalyzer:
     @staticmethod
     def detect_field_category(annotation) -> str:
         """Detecta categoría del campo con pattern matching CORREGIDO"""
-        origin = get_origin(annotation)
-
-        # Manejar Optional primero
-        if origin is Union:
-            args = get_args(annotation)
-            non_none_args = [arg for arg in args if arg is not type(None)]
-            if len(non_none_args) == 1:
-                return TypeAnalyzer.detect_field_category(non_none_args[0])
-
-        # ✅ CORRECCIÓN: Pattern matching con tipos reales, no strings
-        match origin:
-            case _ if origin is set:
-                return FieldCategories.SET
-            case _ if origin is list:
-                return FieldCategories.LIST
-            case _ if origin is tuple:
-                return FieldCategories.TUPLE
-            case _:
-                return TypeAnalyzer._analyze_direct_type(annotation)
+        # Clases planas (la mayoría de campos): directo, sin get_origin
+        if getattr(annotation, "__origin__", None) is None:
+            return TypeAnalyzer._analyze_direct_type(annotation)
+
+        # Genéricos: get_origin/get_args una sola vez por anotación
+        return _generic_field_category(annotation)
 
     @staticmethod
     def _analyze_direct_type(annotation) -> str:
         """Analiza tipos directos con pattern matching corregido"""
         if annotation in PRIMITIVE_TYPES:
             return FieldCategories.PRIMITIVE
-        elif inspect.isclass(annotation) and issubclass(annotation, Enum):
+        elif isinstance(annotation, type) and issubclass(annotation, Enum):
             return FieldCategories.ENUM
         elif TypeAnalyzer.is_pydantic_model(annotation):
             return FieldCategories.EMBEDDED
@@ -435,11 +583,8 @@ class TypeAnalyzer:
     @staticmethod
     def is_pydantic_model(type_class) -> bool:
         """Verifica si es modelo Pydantic"""
-        return (
-            inspect.isclass(type_class)
-            and hasattr(type_class, "model_fields")
-            and issubclass(type_class, BaseModel)
-        )
+        # Toda subclase de BaseModel tiene model_fields: basta con issubclass
+        return isinstance(type_class, type) and issubclass(type_class, BaseModel)
 
     @staticmethod
     def get_element_type_name(element_type) -> str:
@@ -461,107 +606,146 @@ class TypeAnalyzer:
         )
 
 
+@lru_cache(maxsize=1024)
+def _generic_field_category(annotation) -> str:
+    """Categoría de una anotación genérica (Optional, contenedores, ...)"""
+    origin = get_origin(annotation)
+
+    # Manejar Optional primero
+    if origin is Union:
+        args = get_args(annotation)
+        non_none_args = [arg for arg in args if arg is not type(None)]
+        if len(non_none_args) == 1:
+            return TypeAnalyzer.detect_field_category(non_none_args[0])
+
+    # ✅ CORRECCIÓN: Dispatch con tipos reales, no strings
+    category = ORIGIN_CATEGORIES.get(origin)
+    if category is not None:
+        return category
+    return TypeAnalyzer._analyze_direct_type(annotation)
+
+
 # ==================== DEPENDENCY ANALYZER ====================
 
 
 class DependencyAnalyzer:
     """Analizador de dependencias con clasificación correcta"""
 
+    __slots__ = ("all_models",)
+
     def __init__(self, all_models: Dict[str, Type[BaseModel]]):
         self.all_models = all_models
 
-    def extract_dependencies(self, properties: Dict[str, Any]) -> Dict[str, List[str]]:
-        """Extrae y clasifica dependencias"""
+    def extract_dependencies(
+        self, properties: Dict[str, Any]
+    ) -> Optional[Dict[str, List[str]]]:
+        """Extrae y clasifica dependencias (None si la entidad no tiene)"""
         documents = set()
         embeddables = set()
 
         for field_props in properties.values():
-            target_entities = self._extract_target_entities(field_props)
+            entity_name = self._extract_target_entity(field_props)
+            if not entity_name:
+                continue
 
-            for entity_name in target_entities:
-                target_model = self.all_models.get(entity_name)
+            target_model = self.all_models.get(entity_name)
+            if target_model:
+                if self._is_document_type(target_model):
+                    documents.add(entity_name)
+                else:
+                    embeddables.add(entity_name)
 
-                if target_model:
-                    if self._is_document_type(target_model):
-                        documents.add(entity_name)
-                    else:
-                        embeddables.add(entity_name)
+        if not documents and not embeddables:
+            return None
 
         return {
-            SchemaKeys.DOCUMENTS: sorted(list(documents)),
-            SchemaKeys.EMBEDDABLES: sorted(list(embeddables)),
+            SchemaKeys.DOCUMENTS: sorted(documents),
+            SchemaKeys.EMBEDDABLES: sorted(embeddables),
         }
 
-    def _extract_target_entities(self, field_props: Dict[str, Any]) -> List[str]:
-        """Extrae entidades target de un campo"""
+    def _extract_target_entity(self, field_props: Dict[str, Any]) -> Optional[str]:
+        """Extrae la entidad target de un campo (None si no tiene)"""
         field_type = field_props.get(SchemaKeys.TYPE)
 
-        match field_type:
-            case FieldTypes.REFERENCE:
-                target = field_props.get(SchemaKeys.REFERENCE_METADATA, {}).get(
-                    SchemaKeys.TARGET_ENTITY
-                )
-                return [target] if target else []
+        target_keys = TARGET_ENTITY_KEYS.get(field_type)
+        if target_keys is not None:
+            metadata_key, entity_key = target_keys
+            return field_props.get(metadata_key, {}).get(entity_key)
 
-            case FieldTypes.COLLECTION:
-                target = field_props.get(SchemaKeys.COLLECTION_METADATA, {}).get(
-                    SchemaKeys.ELEMENT_ENTITY
-                )
-                return [target] if target else []
-
-            case FieldTypes.OBJECT_ARRAY | FieldTypes.SET:
-                metadata = field_props.get(SchemaKeys.ARRAY_METADATA, {})
-                element_type = metadata.get(SchemaKeys.ELEMENT_TYPE)
-                return (
-                    [element_type]
-                    if element_type and element_type not in EXCLUDED_METADATA_KEYS
-                    else []
-                )
+        if field_type in ARRAY_FIELD_TYPES:
+            metadata = field_props.get(SchemaKeys.ARRAY_METADATA, {})
+            element_type = metadata.get(SchemaKeys.ELEMENT_TYPE)
+            if element_type not in EXCLUDED_METADATA_KEYS:
+                return element_type
 
-            case _:
-                return []
+        return None
 
     def _is_document_type(self, model_class: Type[BaseModel]) -> bool:
         """Verifica si es Document (tiene campo ID)"""
-        for field_info in model_class.model_fields.values():
-            if (
-                not hasattr(field_info, "json_schema_extra")
-                or not field_info.json_schema_extra
-            ):
-                continue
-            metadata = field_info.json_schema_extra.get("metadata", {})
-            if metadata.get(MetadataKeys.ID):
-                return True
-        return False
+        return _is_document_model(model_class)
 
 
 # ==================== MAIN GENERATOR (FIXED) ====================
 
 
+class _EntityFrame:
+    """Entidad en curso en la pila de _process_entity_schema"""
+
+    __slots__ = (
+        "model_class",
+        "fields",
+        "pending",
+        "schema",
+        "current",
+        "properties",
+        "related_models",
+    )
+
+    def __init__(
+        self,
+        model_class: Type[BaseModel],
+        fields,
+        pending: tuple = (),
+        schema: Optional[Dict[str, Any]] = None,
+    ):
+        self.model_class = model_class
+        self.fields = fields  # iterador de (nombre, FieldInfo) pendientes
+        self.pending = iter(pending)  # modelos relacionados del campo actual
+        self.schema = schema  # schema ya cacheado (solo se recorren relacionados)
+        self.current = None  # campo actual, se procesa tras sus relacionados
+        self.properties: Dict[str, Any] = {}
+        self.related_models: List[Type[BaseModel]] = []
+
+
 class DocumentSchemaGenerator:
     """Generador principal con arquitectura limpia - CORREGIDO"""
 
+    __slots__ = (
+        "processed_entities",
+        "all_models",
+        "_field_processor",
+        "_dependency_analyzer",
+    )
+
     def __init__(self):
-        self.processed_entities: Set[str] = set()
+        # Clases ya visitadas: por identidad, no por nombre
+        self.processed_entities: Set[Type[BaseModel]] = set()
         self.all_models: Dict[str, Type[BaseModel]] = {}
-        self._current_entity: Optional[str] = None
         self._field_processor: Optional[FieldProcessor] = None
         self._dependency_analyzer: Optional[DependencyAnalyzer] = None
 
     def generate_schema(self, model_class: Type[BaseModel]) -> Dict[str, Any]:
         """Genera esquema flat optimizado"""
-        self._initialize_generation(model_class)
+        self._initialize_generation()
 
-        return {
-            model_name: self._process_entity_schema(model_cls)
-            for model_name, model_cls in self.all_models.items()
-            if model_name not in self.processed_entities
-        }
+        schemas: Dict[str, Any] = {}
+        self._process_entity_schema(model_class, schemas)
+        return schemas
 
-    def _initialize_generation(self, model_class: Type[BaseModel]):
+    def _initialize_generation(self):
         """Inicializa el estado para generación"""
         self._reset_state()
-        self._discover_all_models(model_class)
+        # Comparten all_models, que se va llenando durante el recorrido
         self._field_processor = FieldProcessor(self.all_models)
         self._dependency_analyzer = DependencyAnalyzer(self.all_models)
 
@@ -569,121 +753,156 @@ class DocumentSchemaGenerator:
         """Resetea estado del generador"""
         self.processed_entities.clear()
         self.all_models.clear()
-        self._current_entity = None
 
-    def _discover_all_models(
-        self, model_class: Type[BaseModel], visited: Optional[Set[str]] = None
+    def _extract_related_models(self, annotation) -> tuple:
+        """Extrae modelos relacionados"""
+        return _related_models(annotation)
+
+    def _process_entity_schema(
+        self, model_class: Type[BaseModel], schemas: Dict[str, Any]
     ):
-        """Descubrimiento recursivo de modelos"""
-        if visited is None:
-            visited = set()
+        """
+        Descubre y procesa las entidades alcanzables desde model_class en un solo
+        recorrido de sus campos.
+
+        Los modelos relacionados se procesan en cuanto aparecen en un campo, así
+        cada model_fields se recorre una vez. La entrada en schemas se reserva al
+        entrar para conservar el orden de descubrimiento.
+
+        El recorrido usa una pila explícita de entidades en curso en lugar de
+        recursión: grafos de modelos profundos no chocan con el límite de
+        recursión y el orden de proceso es el mismo que el recursivo.
+        """
+        stack: List[_EntityFrame] = []
+        self._enter_entity(model_class, schemas, stack)
+
+        while stack:
+            frame = stack[-1]
+
+            # Primero, los modelos relacionados del campo actual aún no vistos
+            related_model = next(frame.pending, None)
+            if related_model is not None:
+                self._enter_entity(related_model, schemas, stack)
+                continue
 
-        model_name = model_class.__name__
-        if model_name in visited:
-            return
+            if frame.current is not None:
+                field_name, field_info = frame.current
+                frame.properties[field_name] = self._process_field_schema(
+                    field_name, field_info, frame.model_class
+                )
+                frame.current = None
+
+            next_field = next(frame.fields, None)
+            if next_field is not None:
+                related_models = self._extract_related_models(next_field[1].annotation)
+                frame.related_models.extend(related_models)
+                frame.pending = iter(related_models)
+                frame.current = next_field
+                continue
 
-        visited.add(model_name)
-        self.all_models[model_name] = model_class
+            stack.pop()
+            self._finish_entity(frame, schemas)
 
-        # Buscar modelos relacionados
-        for field_info in model_class.model_fields.values():
-            for related_model in self._extract_related_models(field_info.annotation):
-                if TypeAnalyzer.is_pydantic_model(related_model):
-                    self._discover_all_models(related_model, visited)
+    def _enter_entity(
+        self,
+        model_class: Type[BaseModel],
+        schemas: Dict[str, Any],
+        stack: List["_EntityFrame"],
+    ):
+        """Registra la entidad (si no se ha visto) y la apila para procesarla"""
+        if model_class in self.processed_entities:
+            return
 
-    def _extract_related_models(self, annotation) -> List[Type]:
-        """Extrae modelos relacionados"""
-        models = []
-        origin = get_origin(annotation)
-
-        if origin is Union:
-            non_none_args = [
-                arg for arg in get_args(annotation) if arg is not type(None)
-            ]
-            for arg in non_none_args:
-                models.extend(self._extract_related_models(arg))
-        elif origin in CONTAINER_TYPES:
-            args = get_args(annotation)
-            if args:
-                models.extend(self._extract_related_models(args[0]))
+        self.processed_entities.add(model_class)
+        self.all_models[model_class.__name__] = model_class
+        schemas[model_class.__name__] = None
+
+        # El schema de una entidad solo depende de su clase: se calcula la primera
+        # vez que algún root la necesita y los demás roots lo reutilizan
+        cached = _ENTITY_SCHEMA_CACHE.get(model_class)
+        if cached is not None:
+            related_models, entity_schema = cached
+            stack.append(
+                _EntityFrame(model_class, iter(()), related_models, entity_schema)
+            )
         else:
-            if TypeAnalyzer.is_pydantic_model(annotation):
-                models.append(annotation)
+            stack.append(
+                _EntityFrame(model_class, iter(_model_field_items(model_class)))
+            )
 
-        return models
+    def _finish_entity(self, frame: "_EntityFrame", schemas: Dict[str, Any]):
+        """Genera la metadata y el schema de una entidad con todos sus campos ya procesados"""
+        model_class = frame.model_class
+        entity_schema = frame.schema
+        if entity_schema is None:
+            entity_metadata = self._generate_entity_metadata(
+                model_class, frame.properties
+            )
+            entity_schema = SchemaBuilder.build_entity_schema(
+                frame.properties, entity_metadata
+            )
+            _ENTITY_SCHEMA_CACHE[model_class] = (
+                tuple(frame.related_models),
+                entity_schema,
+            )
+        schemas[model_class.__name__] = entity_schema
 
-    def _process_entity_schema(self, model_class: Type[BaseModel]) -> Dict[str, Any]:
-        """Procesa esquema de entidad individual"""
-        model_name = model_class.__name__
+    def _process_field_schema(
+        self, field_name: str, field_info, model_class: Type[BaseModel]
+    ) -> Dict[str, Any]:
+        """Procesa campo individual con pattern matching corregido"""
+        metadata = _get_field_metadata(field_info)
 
-        if model_name in self.processed_entities:
-            return {}
+        # Campos sin metadata de document (la mayoría): sin recorrer los flags
+        if metadata:
+            for flag, handler in self._METADATA_FIELD_HANDLERS:
+                if metadata.get(flag):
+                    return handler(self, field_name, field_info, metadata, model_class)
 
-        self.processed_entities.add(model_name)
-        self._current_entity = model_name
+        return self._process_regular_field(field_info)
 
-        # Procesar campos
-        properties = {
-            field_name: self._process_field_schema(field_name, field_info, model_class)
-            for field_name, field_info in model_class.model_fields.items()
-        }
+    def _process_id_field(self, field_name, field_info, metadata, model_class):
+        return SchemaBuilder.build_basic_schema(FieldTypes.ID, Strategies.ID_FIELD)
 
-        # Generar metadata
-        entity_metadata = self._generate_entity_metadata(model_class, properties)
+    def _process_geopoint_field(self, field_name, field_info, metadata, model_class):
+        return SchemaBuilder.build_geppoint_schema(
+            FieldTypes.GEOPOINT, Strategies.GEOPOINT_VALUE
+        )
 
-        return SchemaBuilder.build_entity_schema(properties, entity_metadata)
+    def _process_reference_field(self, field_name, field_info, metadata, model_class):
+        return self._field_processor.process_reference_field(field_info, metadata)
 
-    def _process_field_schema(
-        self, field_name: str, field_info, model_class: Type[BaseModel]
-    ) -> Dict[str, Any]:
-        """Procesa campo individual con pattern matching corregido"""
-        metadata = self._extract_field_metadata(field_info)
+    def _process_collection_field(self, field_name, field_info, metadata, model_class):
+        return self._field_processor.process_collection_field(
+            field_name, field_info, metadata, model_class.__name__
+        )
 
-        if metadata.get(MetadataKeys.ID):
-            return SchemaBuilder.build_basic_schema(FieldTypes.ID, Strategies.ID_FIELD)
-        elif metadata.get(MetadataKeys.GEOPOINT):
-            return SchemaBuilder.build_geppoint_schema(
-                FieldTypes.GEOPOINT, Strategies.GEOPOINT_VALUE
-            )
-        elif metadata.get(MetadataKeys.REFERENCE):
-            return self._field_processor.process_reference_field(field_info, metadata)
-        elif metadata.get(MetadataKeys.COLLECTION):
-            return self._field_processor.process_collection_field(
-                field_name, field_info, metadata, self._current_entity
-            )
-        else:
-            return self._process_regular_field(field_info)
+    # Flags de metadata en orden de prioridad
+    _METADATA_FIELD_HANDLERS = (
+        (MetadataKeys.ID, _process_id_field),
+        (MetadataKeys.GEOPOINT, _process_geopoint_field),
+        (MetadataKeys.REFERENCE, _process_reference_field),
+        (MetadataKeys.COLLECTION, _process_collection_field),
+    )
 
     def _process_regular_field(self, field_info) -> Dict[str, Any]:
         """✅ FIXED: Procesa campos regulares con schemas limpios"""
         annotation = field_info.annotation
         field_category = TypeAnalyzer.detect_field_category(annotation)
 
-        match field_category:
-            case FieldCategories.SET:
-                return self._build_set_schema(annotation)
-            case FieldCategories.LIST:
-                return self._build_list_schema(annotation)
-            case FieldCategories.TUPLE:
-                return (
-                    SchemaBuilder.build_tuple_schema()
-                )  # ✅ FIXED: Sin array_metadata
-            case FieldCategories.PRIMITIVE:
-                return SchemaBuilder.build_basic_schema(
-                    FieldTypes.PRIMITIVE, Strategies.DIRECT
-                )
-            case FieldCategories.ENUM:
-                return SchemaBuilder.build_basic_schema(
-                    FieldTypes.ENUM, Strategies.DIRECT
-                )
-            case FieldCategories.EMBEDDED:
-                return SchemaBuilder.build_basic_schema(
-                    FieldTypes.EMBEDDED, Strategies.DIRECT
-                )
-            case _:
-                return SchemaBuilder.build_basic_schema(
-                    FieldTypes.UNKNOWN, Strategies.DIRECT
-                )
+        # Contenedores: builder propio (tuple ✅ FIXED: sin array_metadata)
+        container_builder = self._CONTAINER_SCHEMA_BUILDERS.get(field_category)
+        if container_builder is not None:
+            return container_builder(self, annotation)
+
+        # primitive / enum / embedded / unknown: schema básico con strategy direct
+        return SchemaBuilder.build_basic_schema(
+            DIRECT_CATEGORY_FIELD_TYPES.get(field_category, FieldTypes.UNKNOWN),
+            Strategies.DIRECT,
+        )
+
+    def _build_tuple_schema(self, annotation) -> Dict[str, Any]:
+        return SchemaBuilder.build_tuple_schema()
 
     def _build_set_schema(self, annotation) -> Dict[str, Any]:
         element_type = self._field_processor._extract_list_element_type(annotation)
@@ -710,12 +929,18 @@ class DocumentSchemaGenerator:
         else:
             return SchemaBuilder.build_simple_array_schema(FieldTypes.SIMPLE_ARRAY)
 
+    _CONTAINER_SCHEMA_BUILDERS = {
+        FieldCategories.SET: _build_set_schema,
+        FieldCategories.LIST: _build_list_schema,
+        FieldCategories.TUPLE: _build_tuple_schema,
+    }
+
     def _generate_entity_metadata(
         self, model_class: Type[BaseModel], properties: Dict[str, Any]
     ) -> Dict[str, Any]:
         """✅ FIXED: Genera metadata de entidad - solo incluir dependencies si existen"""
         model_name = model_class.__name__
-        id_field = self._find_id_field(properties)
+        id_field = self._find_id_field(model_class)
         entity_type = EntityTypes.DOCUMENT if id_field else EntityTypes.EMBEDDABLE
 
         # Metadata base
@@ -723,41 +948,55 @@ class DocumentSchemaGenerator:
 
         # Añadir campos específicos para Document
         if entity_type == EntityTypes.DOCUMENT:
-            metadata.update(
-                {
-                    SchemaKeys.ID_FIELD: id_field,
-                    SchemaKeys.COLLECTION_NAME: plural(model_name.lower()),
-                }
-            )
+            metadata[SchemaKeys.ID_FIELD] = id_field
+            metadata[SchemaKeys.COLLECTION_NAME] = _plural_lower(model_name)
 
         # ✅ FIXED: Solo añadir dependencies si realmente existen
         dependencies = self._dependency_analyzer.extract_dependencies(properties)
-        if dependencies[SchemaKeys.DOCUMENTS] or dependencies[SchemaKeys.EMBEDDABLES]:
+        if dependencies:
             metadata[SchemaKeys.DEPENDENCIES] = dependencies
 
         return metadata
 
-    def _find_id_field(self, properties: Dict[str, Any]) -> Optional[str]:
-        """Encuentra campo ID"""
-        for field_name, field_props in properties.items():
-            if field_props.get(SchemaKeys.TYPE) == FieldTypes.ID:
-                return field_name
-        return None
-
-    def _extract_field_metadata(self, field_info) -> Dict[str, Any]:
-        """Extrae metadata de FieldInfo"""
-        if (
-            not hasattr(field_info, "json_schema_extra")
-            or not field_info.json_schema_extra
-        ):
-            return {}
-        return field_info.json_schema_extra.get("metadata", {})
+    def _find_id_field(self, model_class: Type[BaseModel]) -> Optional[str]:
+        """Encuentra campo ID (ya resuelto por clase, sin recorrer properties)"""
+        return _id_field_name(model_class)
 
 
 # ==================== HELPER FUNCTION ====================
 
 
+# Schema de cada entidad y sus modelos relacionados (en orden de aparición),
+# compartido entre todos los roots que la incluyen
+_ENTITY_SCHEMA_CACHE: "weakref.WeakKeyDictionary[Type[BaseModel], tuple]" = (
+    weakref.WeakKeyDictionary()
+)
+
+# Schema generado por clase root: las clases no cambian en runtime, así que se
+# genera una vez y se libera junto con la clase
+_SCHEMA_CACHE: "weakref.WeakKeyDictionary[Type[BaseModel], Dict[str, Any]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
 def generate_flat_schema(model_class: Type[BaseModel]) -> Dict[str, Any]:
-    """Función helper optimizada"""
-    generator = DocumentSchemaGenerator()
-    return generator.generate_schema(model_class)
+    """
+    Función helper optimizada.
+
+    El schema se comparte entre llamadas para la misma clase: es de solo lectura.
+    """
+    schema = _SCHEMA_CACHE.get(model_class)
+    if schema is None:
+        generator = DocumentSchemaGenerator()
+        schema = _SCHEMA_CACHE[model_class] = generator.generate_schema(model_class)
+    return schema
+
+
+def _clear_schema_cache() -> None:
+    """Descarta los schemas cacheados (roots y entidades), p.ej. en tests"""
+    _SCHEMA_CACHE.clear()
+    _ENTITY_SCHEMA_CACHE.clear()
+
+
+# Misma API que functools.lru_cache
+generate_flat_schema.cache_clear = _clear_schema_cache
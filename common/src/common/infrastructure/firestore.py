@@ -1,6 +1,12 @@
+import asyncio
 import logging
+from functools import lru_cache
+from itertools import islice
+import random
+import time
 from uuid import UUID
 from contextvars import ContextVar
+from google.api_core.exceptions import Aborted
 from google.cloud import firestore
 from google.cloud.firestore import AsyncClient, AsyncTransaction, AsyncDocumentReference
 from google.oauth2.service_account import Credentials
@@ -25,7 +31,13 @@ from typing import (
 )
 from common.ioc import component, ProviderType, inject, deps
 from common.mediator import ordered, CommandPipeLine, PipelineContext
-from .document import Document, DocumentReference, CollectionReference, MixinSerializer
+from .document import (
+    Document,
+    DocumentReference,
+    CollectionReference,
+    MixinSerializer,
+    _get_field_metadata,
+)
 
 # OpenTelemetry
 from opentelemetry import trace
@@ -45,21 +57,60 @@ AsyncTransactionContext = NewType(
 )
 
 
+# Límite de operaciones por commit de Firestore (batch y transacción)
+MAX_BATCH_WRITES = 500
+# Commits de batch en vuelo a la vez (más allá no mejora y aparecen Deadline Exceeded)
+MAX_CONCURRENT_COMMITS = 40
+# Escrituras por segundo que admite Firestore antes de empezar a rechazar
+MAX_WRITES_PER_SEC = 10_000
+# Reintentos de transacciones abortadas por contención (backoff exponencial)
+TRANSACTION_MAX_ATTEMPTS = 5
+TRANSACTION_BACKOFF_BASE = 0.1
+TRANSACTION_BACKOFF_JITTER = 0.1
+
+
+class WriteRateLimiter:
+    """Token bucket de escrituras por segundo, compartido por los repositorios"""
+
+    def __init__(self, max_writes_per_sec: int = MAX_WRITES_PER_SEC):
+        self._rate = max_writes_per_sec
+        self._tokens = float(max_writes_per_sec)
+        self._updated = time.monotonic()
+        # El lock se crea en el primer acquire de cada event loop: un
+        # asyncio.Lock queda ligado al loop en el que se usa
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    async def acquire(self, writes: int = 1) -> None:
+        """Espera hasta que haya cupo para `writes` escrituras"""
+        writes = min(writes, self._rate)
+        async with self._get_lock():
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._rate, self._tokens + (now - self._updated) * self._rate
+                )
+                self._updated = now
+                if self._tokens >= writes:
+                    self._tokens -= writes
+                    return
+                await asyncio.sleep((writes - self._tokens) / self._rate)
+
+
 db: AsyncClient = None
+_write_limiter = WriteRateLimiter()
 context_transaction: AsyncTransactionContext = ContextVar(
     "current_transaction", default=None
 )
 
 
-async def resolve_document_reference(doc_ref: AsyncDocumentReference) -> Dict[str, Any]:
-    path_parts = doc_ref.path.split("/")
-    collection = path_parts[-2]
-    doc_id = path_parts[-1]
-
-    error = DocumentNotFound(doc_id, collection)
-    return await RepositoryFirestore.__get(doc_ref, error)
-
-
 def get_db() -> AsyncClient:
     if db is None:
         raise RuntimeError("DB no inicializada")
@@ -78,91 +129,137 @@ def get_current_transaction() -> Optional[AsyncTransaction]:
 def initialize_database(
     credentials_path: str,
     database: str = "(default)",
+    max_writes_per_sec: int = MAX_WRITES_PER_SEC,
 ):
-    global db
+    global db, _write_limiter
     credentials_path = get_path(credentials_path)
     
     cred = Credentials.from_service_account_file(credentials_path)
     db = AsyncClient(project=cred.project_id, credentials=cred, database=database)
+    _write_limiter = WriteRateLimiter(max_writes_per_sec)
+    _doc_ref_from_path.cache_clear()
+
+
+
+def create_doc_ref_from_path(db, path: str):
+    """Crea AsyncDocumentReference usando db.collection().document() por niveles"""
+    return _doc_ref_from_path(db, path)
+
+
+@lru_cache(maxsize=4096)
+def _doc_ref_from_path(db, path: str):
+    """
+    Referencia de un path, construida sobre la del documento padre (cacheada):
+    los hermanos de una subcollection comparten el recorrido del prefijo.
+    """
+    if path.count('/') % 2:
+        # Número par de segmentos: .../coleccion/documento
+        head, _, doc_id = path.rpartition('/')
+        parent_path, _, collection_name = head.rpartition('/')
+        parent = _doc_ref_from_path(db, parent_path) if parent_path else db
+        return parent.collection(collection_name).document(doc_id)
+
+    # Número impar: el path termina en una colección
+    parent_path, _, collection_name = path.rpartition('/')
+    parent = _doc_ref_from_path(db, parent_path) if parent_path else db
+    return parent.collection(collection_name)
 
 
+# Hojas que se copian tal cual: sin referencias que convertir
+_PLAIN_TYPES = frozenset({str, int, float, bool})
+
+
+def _push_frame(frames: list, value, key_in_parent) -> None:
+    """Apila un contenedor pendiente de recorrer y la clave donde irá en su padre"""
+    if isinstance(value, dict):
+        frames.append((value, iter(value.items()), {}, key_in_parent))
+    else:
+        frames.append((value, iter(value), [], key_in_parent))
+
+
+def _attach_to_parent(frames: list, key_in_parent, value) -> None:
+    """Coloca el valor ya procesado en el contenedor del frame padre"""
+    parent_result = frames[-1][2]
+    if type(parent_result) is dict:
+        parent_result[key_in_parent] = value
+    else:
+        parent_result.append(value)
+
+
+def _extract_firestore_documents(obj, commands: list, db):
+    """
+    Recorre el dump una sola vez: separa los documentos de subcollection y
+    convierte las referencias del resto.
+
+    Cada dict con CollectionReference como id se añade a commands como
+    (nivel, doc_ref, datos) y se quita de su padre. Lo que queda es el
+    documento ya limpio y convertido (igual que convert_document_references
+    sobre el dump sin subcollections).
+
+    El recorrido es iterativo, con una pila de frames (contenedor, iterador de
+    hijos, resultado, clave en el padre); los documentos se añaden a commands
+    en post-orden, hijos antes que su padre.
+    """
+    if not isinstance(obj, (dict, list, set)):
+        # Hojas y tuplas: no contienen subcollections, solo referencias a convertir
+        return convert_document_references(obj)
+
+    frames = []
+    _push_frame(frames, obj, None)
+    while True:
+        obj, children, result, key_in_parent = frames[-1]
+
+        if type(result) is dict:
+            for key, value in children:
+                if type(value) in _PLAIN_TYPES:
+                    result[key] = value
+                elif isinstance(value, (dict, list, set)):
+                    _push_frame(frames, value, key)
+                    break
+                else:
+                    converted = convert_document_references(value)
+                    if converted is not None:
+                        result[key] = converted
+            else:
+                frames.pop()
+                collection_ref = obj.get('id')
+                if isinstance(collection_ref, CollectionReference):
+                    # Documento de subcollection: sus datos son todo excepto el
+                    # 'id' (la CollectionReference ya se descartó al convertir)
+                    level = len(collection_ref.path.split('/')) // 2
+                    doc_ref = create_doc_ref_from_path(db, collection_ref.path)
+                    commands.append((level, doc_ref, result))
+                    result = None
+                if not frames:
+                    return result
+                if result is not None:
+                    _attach_to_parent(frames, key_in_parent, result)
+        else:
+            for item in children:
+                if type(item) in _PLAIN_TYPES:
+                    result.append(item)
+                elif isinstance(item, (dict, list, set)):
+                    _push_frame(frames, item, None)
+                    break
+                else:
+                    converted = convert_document_references(item)
+                    if converted is not None:
+                        result.append(converted)
+            else:
+                frames.pop()
+                if isinstance(obj, set):
+                    result = set(result)
+                if not frames:
+                    return result
+                _attach_to_parent(frames, key_in_parent, result)
+
 
 def generate_firestore_commands(data: dict, db):
     """
     Extrae CollectionReference del JSON y genera comandos Firestore ordenados por nivel jerárquico.
     """
     commands = []
-    
-    def create_doc_ref_from_path(path: str):
-        """Crea AsyncDocumentReference usando db.collection().document() por niveles"""
-        path_parts = path.split('/')
-        doc_ref = db
-        
-        for i in range(0, len(path_parts), 2):
-            if i < len(path_parts):
-                doc_ref = doc_ref.collection(path_parts[i])
-            if i + 1 < len(path_parts):
-                doc_ref = doc_ref.document(path_parts[i + 1])
-        
-        return doc_ref
-    
-    def process_object(obj):
-        """Procesa recursivamente el objeto buscando CollectionReference"""
-        
-        if isinstance(obj, dict):
-            # Verificar si este dict representa un documento con CollectionReference como id
-            if 'id' in obj and isinstance(obj['id'], CollectionReference):
-                collection_ref = obj['id']
-                
-                # Crear el documento de Firestore
-                doc_ref = create_doc_ref_from_path(collection_ref.path)
-                
-                # Extraer los datos (todo excepto el 'id')
-                doc_data = {}
-                for key, value in obj.items():
-                    if key == 'id':
-                        continue  # Skip CollectionReference id
-                    else:
-                        # Procesar recursivamente para limpiar subcollections anidadas
-                        processed_value = process_object(value)
-                        if processed_value is not None:
-                            doc_data[key] = processed_value
-                
-                # Convertir DocumentReference a AsyncDocumentReference en los datos
-                doc_data = convert_document_references(doc_data)
-                
-                # Calcular nivel jerárquico
-                level = len(collection_ref.path.split('/')) // 2
-                commands.append((level, doc_ref, doc_data))
-                
-                # Retornar None para indicar que este nivel se procesó como subcollection
-                return None
-            
-            else:
-                # Dict normal, procesar recursivamente
-                result = {}
-                for key, value in obj.items():
-                    processed_value = process_object(value)
-                    if processed_value is not None:
-                        result[key] = processed_value
-                return result
-        
-        elif isinstance(obj, (list, set)):
-            # Procesar listas/sets
-            result = []
-            for item in obj:
-                processed_item = process_object(item)
-                if processed_item is not None:
-                    result.append(processed_item)
-            
-            return set(result) if isinstance(obj, set) else result
-        
-        else:
-            # Tipos primitivos
-            return obj
-    
-    # Procesar todos los datos
-    process_object(data)
+    _extract_firestore_documents(data, commands, db)
     
     # Ordenar comandos por nivel jerárquico
     commands.sort(key=lambda x: x[0])
@@ -170,42 +267,108 @@ def generate_firestore_commands(data: dict, db):
     return [(doc_ref, doc_data) for level, doc_ref, doc_data in commands]
 
 
-def convert_document_references(data):
-    """
-    Convierte DocumentReference a AsyncDocumentReference, ignora CollectionReference
-    """
+# Conversión de hojas por tipo exacto: un lookup en vez de la cascada de isinstance
+_LEAF_CONVERTERS: Dict[type, Callable[[Any], Any]] = {
+    DocumentReference: lambda data: get_document(data.path),
+    CollectionReference: lambda data: None,
+    UUID: str,
+}
+
+
+def _convert_reference_leaf(data):
+    """Convierte un valor que no es contenedor (referencias y UUID)"""
+    converter = _LEAF_CONVERTERS.get(type(data))
+    if converter is not None:
+        return converter(data)
+    # Subclases: mismo resultado por isinstance
     if isinstance(data, DocumentReference):
         return get_document(data.path)
     elif isinstance(data, CollectionReference):
         # Las CollectionReference se ignoran (ya procesadas por generate_firestore_commands)
         return None
-    elif isinstance(data, dict):
-        result = {}
-        for key, value in data.items():
-            converted = convert_document_references(value)
-            if converted is not None:
-                result[key] = converted
-        return result
-    elif isinstance(data, (list, tuple)):
-        result = []
-        for item in data:
-            converted = convert_document_references(item)
-            if converted is not None:
-                result.append(converted)
-        return tuple(result) if isinstance(data, tuple) else result
-    elif isinstance(data, set):
-        result = set()
-        for item in data:
-            converted = convert_document_references(item)
-            if converted is not None:
-                result.add(converted)
-        return result
     elif isinstance(data, UUID):
         return str(data)
     else:
         return data
 
 
+def _conversion_frame(value, key_in_parent) -> list:
+    """Frame de convert_document_references: [contenedor, hijos, copia, clave en el padre]"""
+    children = iter(value.items()) if isinstance(value, dict) else enumerate(value)
+    return [value, children, None, key_in_parent]
+
+
+def _store_converted(frame: list, position, value, converted) -> None:
+    """
+    Guarda un hijo ya convertido en la copia del contenedor del frame.
+
+    La copia solo se crea cuando un hijo cambia (o se descarta por ser None):
+    hasta entonces los hijos vistos son idénticos a los originales y basta con
+    copiar ese prefijo.
+    """
+    result = frame[2]
+    if result is None:
+        if converted is value and converted is not None:
+            return
+        obj = frame[0]
+        if isinstance(obj, dict):
+            result = {}
+            for key, item in obj.items():
+                if key is position:
+                    break
+                result[key] = item
+        else:
+            result = list(islice(obj, position))
+        frame[2] = result
+    if converted is not None:
+        if type(result) is dict:
+            result[position] = converted
+        else:
+            result.append(converted)
+
+
+def convert_document_references(data):
+    """
+    Convierte DocumentReference a AsyncDocumentReference, ignora CollectionReference
+
+    Recorrido iterativo con una pila de frames. Los contenedores en los que no
+    cambia nada se devuelven tal cual (compartidos) en vez de copiarse.
+    """
+    if not isinstance(data, (dict, list, tuple, set)):
+        return _convert_reference_leaf(data)
+
+    frames = [_conversion_frame(data, None)]
+    while True:
+        frame = frames[-1]
+        for position, value in frame[1]:
+            if type(value) in _PLAIN_TYPES:
+                result = frame[2]
+                if result is not None:
+                    if type(result) is dict:
+                        result[position] = value
+                    else:
+                        result.append(value)
+            elif isinstance(value, (dict, list, tuple, set)):
+                frames.append(_conversion_frame(value, position))
+                break
+            else:
+                _store_converted(frame, position, value, _convert_reference_leaf(value))
+        else:
+            frames.pop()
+            obj, _, result, key_in_parent = frame
+            if result is None:
+                converted = obj
+            elif isinstance(obj, tuple):
+                converted = tuple(result)
+            elif isinstance(obj, set):
+                converted = set(result)
+            else:
+                converted = result
+            if not frames:
+                return converted
+            _store_converted(frames[-1], key_in_parent, obj, converted)
+
+
 def to_firestore(model):
     """
     Convierte un modelo Pydantic a un diccionario listo para Firestore.
@@ -215,43 +378,19 @@ def to_firestore(model):
     return convert_document_references(model_dict)
 
 
-def remove_subcollections(data):
+@lru_cache(maxsize=None)
+def _collection_fields(model_class) -> frozenset:
     """
-    Remueve objetos que contienen CollectionReference como id del diccionario principal
-    """
-    if isinstance(data, dict):
-        if 'id' in data and isinstance(data['id'], CollectionReference):
-            # Este es un documento que debe ir en subcollection, no en el documento principal
-            return None
-        
-        result = {}
-        for key, value in data.items():
-            cleaned_value = remove_subcollections(value)
-            if cleaned_value is not None:
-                result[key] = cleaned_value
-        return result
-    
-    elif isinstance(data, (list, set)):
-        result = []
-        for item in data:
-            cleaned_item = remove_subcollections(item)
-            if cleaned_item is not None:
-                result.append(cleaned_item)
-        return set(result) if isinstance(data, set) else result
-    
-    else:
-        return data
-
+    Plan de escritura de una clase: campos collection() del documento raíz.
 
-def to_firestore_main_document(model):
+    Solo de ellos salen documentos de subcollection; el resto de campos
+    tiene forma fija y basta con convertir sus referencias.
     """
-    Convierte solo el documento principal (sin subcollections) para Firestore
-    """
-    model_dict = model.model_dump(context={"is_root": True})
-    # Remover subcollections
-    cleaned_dict = remove_subcollections(model_dict)
-    # Convertir referencias normales
-    return convert_document_references(cleaned_dict)
+    return frozenset(
+        name
+        for name, field_info in model_class.model_fields.items()
+        if _get_field_metadata(field_info).get("collection")
+    )
 
 
 def prepare_all_firestore_commands(document, collection_ref, db):
@@ -262,17 +401,129 @@ def prepare_all_firestore_commands(document, collection_ref, db):
     # Obtener datos serializados
     model_dict = document.model_dump(context={"is_root": True})
     
-    # Extraer comandos para subcollections
-    subcollection_commands = generate_firestore_commands(model_dict, db)
-    
-    # Preparar documento principal (nivel 0)
-    main_doc_ref = collection_ref.document(str(document.id))
-    main_data = to_firestore_main_document(document)
-    
-    # Combinar: principal primero, luego subcollections (ya están ordenadas por nivel)
-    all_commands = [(main_doc_ref, main_data)] + subcollection_commands
-    
-    return all_commands
+    # Un único recorrido: documento principal limpio + comandos de subcollections.
+    # Solo los campos collection() se recorren buscando documentos anidados.
+    collection_fields = _collection_fields(type(document))
+    commands = []
+    main_data = {}
+    for key, value in model_dict.items():
+        if type(value) in _PLAIN_TYPES:
+            converted = value
+        elif key in collection_fields:
+            converted = _extract_firestore_documents(value, commands, db)
+        else:
+            converted = convert_document_references(value)
+        if converted is not None:
+            main_data[key] = converted
+
+    # Principal primero (nivel 0), luego subcollections por nivel. Se ordena y
+    # se quita el nivel sobre la misma lista, sin copias intermedias
+    commands.insert(0, (0, collection_ref.document(str(document.id)), main_data))
+    commands.sort(key=lambda x: x[0])
+    for i, (level, doc_ref, doc_data) in enumerate(commands):
+        commands[i] = (doc_ref, doc_data)
+
+    return commands
+
+
+def _batch_create(batch, doc_ref, data) -> None:
+    batch.create(doc_ref, data)
+
+
+def _batch_set(batch, doc_ref, data) -> None:
+    batch.set(doc_ref, data)
+
+
+def _batch_delete(batch, doc_ref, data) -> None:
+    batch.delete(doc_ref)
+
+
+async def commit_create_commands(db, commands) -> None:
+    """Crea los documentos (doc_ref, datos) en batches de hasta MAX_BATCH_WRITES"""
+    await commit_batched_writes(db, commands, _batch_create)
+
+
+async def commit_batched_writes(
+    db, commands, write: Callable[[Any, Any, Any], None]
+) -> None:
+    """
+    Aplica write(batch, doc_ref, datos) a cada comando en batches de hasta
+    MAX_BATCH_WRITES.
+
+    Un commit por bloque en vez de un round-trip por documento; si hay varios
+    bloques se envían a la vez (como mucho MAX_CONCURRENT_COMMITS en vuelo y
+    sin pasar de las escrituras por segundo del limitador).
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_COMMITS)
+
+    async def commit(start):
+        # El batch se construye dentro del semáforo: solo los bloques en vuelo
+        # tienen sus escrituras en memoria
+        async with semaphore:
+            chunk = commands[start : start + MAX_BATCH_WRITES]
+            batch = db.batch()
+            for doc_ref, data in chunk:
+                write(batch, doc_ref, data)
+            await _write_limiter.acquire(len(chunk))
+            await batch.commit()
+
+    await asyncio.gather(
+        *(commit(start) for start in range(0, len(commands), MAX_BATCH_WRITES))
+    )
+
+
+def _has_doc_ref(data: Any) -> bool:
+    """Indica si hay alguna AsyncDocumentReference que to_document resolvería (en dicts anidados)"""
+    pending = [data]
+    while pending:
+        value = pending.pop()
+        # Comprobaciones por tipo exacto primero: dicts y escalares son lo habitual
+        value_type = type(value)
+        if value_type is dict:
+            pending.extend(value.values())
+        elif value_type in _PLAIN_TYPES or value is None:
+            continue
+        elif isinstance(value, AsyncDocumentReference):
+            return True
+        elif isinstance(value, dict):
+            pending.extend(value.values())
+    return False
+
+
+def _collect_doc_refs(data: Any, refs: Dict[str, AsyncDocumentReference]) -> None:
+    """Añade a refs, por path, las AsyncDocumentReference que to_document resolvería"""
+    pending = [data]
+    while pending:
+        value = pending.pop()
+        value_type = type(value)
+        if value_type is dict:
+            pending.extend(value.values())
+        elif value_type in _PLAIN_TYPES or value is None:
+            continue
+        elif isinstance(value, AsyncDocumentReference):
+            refs[value.path] = value
+        elif isinstance(value, dict):
+            pending.extend(value.values())
+
+
+async def get_referenced_documents(
+    db: AsyncClient,
+    refs: Dict[str, AsyncDocumentReference],
+    transaction: Optional[AsyncTransaction] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Lee los documentos referenciados con un solo get_all (una RPC en vez de
+    un get por referencia). Devuelve {path: datos}; si alguno no existe lanza
+    DocumentNotFound con su id y su colección.
+    """
+    documents = {}
+    async for snapshot in db.get_all(list(refs.values()), transaction=transaction):
+        path = snapshot.reference.path
+        if not snapshot.exists:
+            path_parts = path.split("/")
+            raise DocumentNotFound(path_parts[-1], path_parts[-2])
+        documents[path] = {"id": snapshot.id, **snapshot.to_dict()}
+    return documents
 
 
 async def to_document(
@@ -280,22 +531,69 @@ async def to_document(
 ) -> Dict[str, Any]:
     """
     Convierte AsyncDocumentReference a otros objetos usando un callback async.
-    Recorre la estructura una sola vez.
+    Recorre la estructura una sola vez; sin referencias se devuelve tal cual.
     """
-    match data:
-        case AsyncDocumentReference():
-            return await callback(data)
-        case dict():
-            return {k: await to_document(v, callback) for k, v in data.items()}
-        case _:
-            return data
+    if not _has_doc_ref(data):
+        return data
+    return await _resolve_references(data, callback)
+
+
+async def _resolve_references(
+    data: Any, callback: Callable[[AsyncDocumentReference], Awaitable[Any]]
+) -> Any:
+    """
+    Copia los dicts anotando dónde está cada referencia, resuelve todas a la
+    vez con gather y coloca los resultados en su sitio.
+
+    Con K referencias son K lecturas en paralelo en vez de K round-trips
+    seguidos; el callback se llama en el mismo orden que el recorrido recursivo.
+    """
+    if isinstance(data, AsyncDocumentReference):
+        return await callback(data)
+    if not isinstance(data, dict):
+        return data
+
+    root = {}
+    slots = []
+    refs = []
+    frames = [(root, iter(data.items()))]
+    while frames:
+        copy, items = frames[-1]
+        for key, value in items:
+            value_type = type(value)
+            if value_type is dict or (
+                value_type not in _PLAIN_TYPES and isinstance(value, dict)
+            ):
+                copy[key] = child = {}
+                frames.append((child, iter(value.items())))
+                break
+            # Las referencias se quedan de momento: así la clave conserva su posición
+            copy[key] = value
+            if value_type in _PLAIN_TYPES:
+                continue
+            if isinstance(value, AsyncDocumentReference):
+                slots.append((copy, key))
+                refs.append(value)
+        else:
+            frames.pop()
+
+    results = await asyncio.gather(*(callback(ref) for ref in refs))
+    for (copy, key), result in zip(slots, results):
+        copy[key] = result
+    return root
 
 
 # --- MIXIN DE INSTRUMENTACIÓN ---
 
 
 class FirestoreTracingMixin:
-    def _start_span(self, operation: str, *, db_statement: Optional[str] = None):
+    def _start_span(
+        self,
+        operation: str,
+        *,
+        db_statement: Optional[str] = None,
+        statement_args: Tuple[Any, ...] = (),
+    ):
         span_name = f"infrastructure.firestore.{operation}.{self._collection_name}"
         ctx_manager = tracer.start_as_current_span(
             span_name, kind=trace.SpanKind.CLIENT
@@ -303,26 +601,44 @@ class FirestoreTracingMixin:
         span = ctx_manager.__enter__()  # activa el contexto y devuelve el span real
         span._ctx_manager = ctx_manager  # guardamos para cerrarlo en _end_span
 
-        # --- Atributos comunes (OTel DB semantic conventions) ---
-        span.set_attribute("db.system", "firestore")
-        span.set_attribute("db.name", getattr(self._db, "_database", "(default)"))
-        span.set_attribute("db.namespace", self._db.project)  # projectId de GCP
-        span.set_attribute("db.collection.name", self._collection_name)
+        # Sin exportador o descartado por el sampler: no se calcula ningún atributo
+        if not span.is_recording():
+            return span
+
+        # --- Atributos comunes (precalculados en _build_span_attributes) ---
+        span.set_attributes(self._base_span_attrs)
         span.set_attribute("db.operation", operation)
-        span.set_attribute(
-            "code.namespace",
-            f"{self.__class__.__module__}.{self.__class__.__name__}",
-        )
-        span.set_attribute(
-            "repository.model", f"{self.__class__.__module__}.{self._cls.__name__}"
-        )
 
-        # --- Statement (pseudo-SQL) ---
+        # --- Statement (pseudo-SQL): plantilla %-format, formateada solo si el span se registra ---
         if db_statement:
-            span.set_attribute("db.statement", db_statement)
+            span.set_attribute("db.statement", db_statement % statement_args)
 
         return span
 
+    def _build_span_attributes(self) -> Dict[str, str]:
+        """Atributos constantes de los spans del repositorio (OTel DB semantic conventions)"""
+        return {
+            "db.system": "firestore",
+            "db.name": getattr(self._db, "_database", "(default)"),
+            "db.namespace": self._db.project,  # projectId de GCP
+            "db.collection.name": self._collection_name,
+            "code.namespace": f"{self.__class__.__module__}.{self.__class__.__name__}",
+            "repository.model": f"{self.__class__.__module__}.{self._cls.__name__}",
+        }
+
+    def _build_statement_templates(self) -> None:
+        """Plantillas de los statements pseudo-SQL, con el nombre de la colección ya puesto"""
+        collection_name = self._collection_name
+        self._insert_statement = f"INSERT INTO {collection_name} (id=%s) [transaction=%s]"
+        self._update_statement = (
+            f"UPDATE {collection_name} SET ... WHERE id=%s [transaction=%s]"
+        )
+        self._delete_statement = f"DELETE FROM {collection_name} WHERE id=%s [transaction=%s]"
+        self._find_statement = f"SELECT * FROM {collection_name} WHERE %s=%s [transaction=%s]"
+        self._find_limit_statement = (
+            f"SELECT * FROM {collection_name} WHERE %s=%s LIMIT %s [transaction=%s]"
+        )
+
     def _end_span(self, span, error: Optional[Exception] = None):
         if error:
             span.record_exception(error)
@@ -345,7 +661,7 @@ class RepositoryFirestore(FirestoreTracingMixin, Generic[T]):
             if origin is RepositoryFirestore:
                 args = get_args(base)
                 if args:
-                    cls._document_type = args[0]
+                    cls._set_document_type(args[0])
                     break
         else:
             for base in cls.__mro__:
@@ -355,9 +671,16 @@ class RepositoryFirestore(FirestoreTracingMixin, Generic[T]):
                         if origin is RepositoryFirestore:
                             args = get_args(orig_base)
                             if args:
-                                cls._document_type = args[0]
+                                cls._set_document_type(args[0])
                                 return
 
+    @classmethod
+    def _set_document_type(cls, document_type) -> None:
+        """Tipo de documento y nombre de la colección, calculados una vez por clase"""
+        cls._document_type = document_type
+        if isinstance(document_type, type):
+            cls._collection_name = plural(document_type.__name__.lower())
+
     @inject
     def __init__(self, db: AsyncClient = deps(AsyncClient)):
 
@@ -375,8 +698,10 @@ class RepositoryFirestore(FirestoreTracingMixin, Generic[T]):
             )
 
         self._cls = cls
-        self._collection_name = plural(cls.__name__.lower())
+        self._collection_name = self.__class__._collection_name
         self._db = db
+        self._base_span_attrs = self._build_span_attributes()
+        self._build_statement_templates()
 
     def __get_collection(self):
         return self._db.collection(self._collection_name)
@@ -387,11 +712,11 @@ class RepositoryFirestore(FirestoreTracingMixin, Generic[T]):
     document: T,
     transaction: Optional[AsyncTransaction] = deps(AsyncTransaction),
     ) -> None:
-        statement = (
-            f"INSERT INTO {self._collection_name} (id={document.id}) "
-            f"[transaction={transaction is not None}]"
+        span = self._start_span(
+            "insert",
+            db_statement=self._insert_statement,
+            statement_args=(document.id, transaction is not None),
         )
-        span = self._start_span("insert", db_statement=statement)
         error: Optional[Exception] = None
         try:
             # Preparar todos los comandos (principal + subcollections)
@@ -399,11 +724,15 @@ class RepositoryFirestore(FirestoreTracingMixin, Generic[T]):
             
             # Crear todos los documentos en orden
             if transaction is not None:
+                if len(all_commands) > MAX_BATCH_WRITES:
+                    logger.warning(
+                        f"⚠️ {len(all_commands)} escrituras en una transacción sobre "
+                        f"{self._collection_name}: Firestore admite {MAX_BATCH_WRITES} por commit"
+                    )
                 for doc_ref, data in all_commands:
                     transaction.create(doc_ref, data)
             else:
-                for doc_ref, data in all_commands:
-                    await doc_ref.create(data)
+                await commit_create_commands(self._db, all_commands)
 
             logger.debug(
                 f"📝 Documentos creados en {self._collection_name}: {document.id} "
@@ -415,29 +744,17 @@ class RepositoryFirestore(FirestoreTracingMixin, Generic[T]):
         finally:
             self._end_span(span, error)
 
-    @staticmethod
-    @inject
-    async def __get(
-        doc_ref: AsyncDocumentReference,
-        error: DocumentNotFound,
-        transaction: Optional[AsyncTransaction] = deps(AsyncTransaction),
-    ) -> dict:
-        doc_snapshot = await doc_ref.get(transaction=transaction)
-        if doc_snapshot.exists:
-            return {"id": doc_snapshot.id, **doc_snapshot.to_dict()}
-        raise error
-
     @inject
     async def update(
         self,
         document: T,
         transaction: Optional[AsyncTransaction] = deps(AsyncTransaction),
     ) -> None:
-        statement = (
-            f"UPDATE {self._collection_name} SET ... WHERE id={document.id} "
-            f"[transaction={transaction is not None}]"
+        span = self._start_span(
+            "update",
+            db_statement=self._update_statement,
+            statement_args=(document.id, transaction is not None),
         )
-        span = self._start_span("update", db_statement=statement)
         error: Optional[Exception] = None
         try:
             doc_ref = self.__get_collection().document(str(document.id))
@@ -445,6 +762,7 @@ class RepositoryFirestore(FirestoreTracingMixin, Generic[T]):
             if transaction is not None:
                 transaction.set(doc_ref, update_data)
             else:
+                await _write_limiter.acquire()
                 await doc_ref.set(update_data)
 
             logger.debug(
@@ -460,17 +778,18 @@ class RepositoryFirestore(FirestoreTracingMixin, Generic[T]):
     async def delete(
         self, doc: T, transaction: Optional[AsyncTransaction] = deps(AsyncTransaction)
     ) -> None:
-        statement = (
-            f"DELETE FROM {self._collection_name} WHERE id={doc.id} "
-            f"[transaction={transaction is not None}]"
+        span = self._start_span(
+            "delete",
+            db_statement=self._delete_statement,
+            statement_args=(doc.id, transaction is not None),
         )
-        span = self._start_span("delete", db_statement=statement)
         error: Optional[Exception] = None
         try:
             doc_ref = self.__get_collection().document(str(doc.id))
             if transaction is not None:
                 transaction.delete(doc_ref)
             else:
+                await _write_limiter.acquire()
                 await doc_ref.delete()
 
             logger.debug(f"🗑️ Documento eliminado de {self._collection_name}: {doc.id}")
@@ -480,6 +799,108 @@ class RepositoryFirestore(FirestoreTracingMixin, Generic[T]):
         finally:
             self._end_span(span, error)
 
+    @inject
+    async def create_many(
+        self,
+        documents: List[T],
+        transaction: Optional[AsyncTransaction] = deps(AsyncTransaction),
+    ) -> None:
+        """Crea varios documentos (con sus subcollections) en batches compartidos"""
+        span = self._start_span("insert_many")
+        error: Optional[Exception] = None
+        try:
+            collection_ref = self.__get_collection()
+            all_commands = []
+            for document in documents:
+                all_commands.extend(
+                    prepare_all_firestore_commands(document, collection_ref, self._db)
+                )
+            span.set_attribute("db.batch.size", len(all_commands))
+            await self.__write_many(all_commands, _batch_create, transaction)
+
+            logger.debug(
+                f"📝 {len(documents)} documentos creados en {self._collection_name} "
+                f"({len(all_commands)} escrituras)"
+            )
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._end_span(span, error)
+
+    @inject
+    async def update_many(
+        self,
+        documents: List[T],
+        transaction: Optional[AsyncTransaction] = deps(AsyncTransaction),
+    ) -> None:
+        """Actualiza varios documentos en batches de hasta MAX_BATCH_WRITES"""
+        span = self._start_span("update_many")
+        error: Optional[Exception] = None
+        try:
+            collection_ref = self.__get_collection()
+            all_commands = [
+                (collection_ref.document(str(document.id)), to_firestore(document))
+                for document in documents
+            ]
+            span.set_attribute("db.batch.size", len(all_commands))
+            await self.__write_many(all_commands, _batch_set, transaction)
+
+            logger.debug(
+                f"📝 {len(documents)} documentos actualizados en {self._collection_name}"
+            )
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._end_span(span, error)
+
+    @inject
+    async def delete_many(
+        self,
+        docs: List[T],
+        transaction: Optional[AsyncTransaction] = deps(AsyncTransaction),
+    ) -> None:
+        """Elimina varios documentos en batches de hasta MAX_BATCH_WRITES"""
+        span = self._start_span("delete_many")
+        error: Optional[Exception] = None
+        try:
+            collection_ref = self.__get_collection()
+            all_commands = [
+                (collection_ref.document(str(doc.id)), None) for doc in docs
+            ]
+            span.set_attribute("db.batch.size", len(all_commands))
+            await self.__write_many(all_commands, _batch_delete, transaction)
+
+            logger.debug(
+                f"🗑️ {len(docs)} documentos eliminados de {self._collection_name}"
+            )
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._end_span(span, error)
+
+    async def __write_many(
+        self,
+        commands: List[Tuple[Any, Any]],
+        write: Callable[[Any, Any, Any], None],
+        transaction: Optional[AsyncTransaction],
+    ) -> None:
+        """Escribe los comandos en la transacción actual o en batches sin transacción"""
+        if transaction is None:
+            await commit_batched_writes(self._db, commands, write)
+            return
+
+        if len(commands) > MAX_BATCH_WRITES:
+            logger.warning(
+                f"⚠️ {len(commands)} escrituras en una transacción sobre "
+                f"{self._collection_name}: Firestore admite {MAX_BATCH_WRITES} por commit"
+            )
+        # La transacción acepta las mismas operaciones que un batch
+        for doc_ref, data in commands:
+            write(transaction, doc_ref, data)
+
     @inject
     async def find_by_field(
         self,
@@ -489,12 +910,38 @@ class RepositoryFirestore(FirestoreTracingMixin, Generic[T]):
         transaction: Optional[AsyncTransaction] = deps(AsyncTransaction),
     ) -> list[T]:
         _value = str(value) if isinstance(value, UUID) else value
-        statement = (
-            f"SELECT * FROM {self._collection_name} WHERE {field}={_value}"
-            + (f" LIMIT {limit}" if limit else "")
-            + f" [transaction={transaction is not None}]"
-        )
-        span = self._start_span("find", db_statement=statement)
+        return await self.__find(field, _value, limit, transaction)
+
+    @inject
+    async def find_by_uuid(
+        self,
+        field: str,
+        value: UUID,
+        limit: Optional[int] = None,
+        transaction: Optional[AsyncTransaction] = deps(AsyncTransaction),
+    ) -> list[T]:
+        """find_by_field para valores que se sabe que son UUID (guardados como str)"""
+        return await self.__find(field, str(value), limit, transaction)
+
+    async def __find(
+        self,
+        field: str,
+        _value: Any,
+        limit: Optional[int],
+        transaction: Optional[AsyncTransaction],
+    ) -> list[T]:
+        if limit:
+            span = self._start_span(
+                "find",
+                db_statement=self._find_limit_statement,
+                statement_args=(field, _value, limit, transaction is not None),
+            )
+        else:
+            span = self._start_span(
+                "find",
+                db_statement=self._find_statement,
+                statement_args=(field, _value, transaction is not None),
+            )
         error: Optional[Exception] = None
         try:       
             
@@ -502,14 +949,21 @@ class RepositoryFirestore(FirestoreTracingMixin, Generic[T]):
             if limit:
                 query = query.limit(limit)
             docs = query.stream(transaction=transaction)
-            results = [
-                self._cls(
-                    **await to_document(
-                        {"id": doc.id, **doc.to_dict()}, resolve_document_reference
-                    )
-                )
-                async for doc in docs
-            ]
+            documents = [{"id": doc.id, **doc.to_dict()} async for doc in docs]
+
+            # Las referencias de todos los resultados se leen con un único get_all
+            refs: Dict[str, AsyncDocumentReference] = {}
+            for data in documents:
+                _collect_doc_refs(data, refs)
+            if refs:
+                referenced = await get_referenced_documents(self._db, refs, transaction)
+
+                async def resolve(doc_ref: AsyncDocumentReference) -> Dict[str, Any]:
+                    return referenced[doc_ref.path]
+
+                documents = [await to_document(data, resolve) for data in documents]
+
+            results = [self._cls(**data) for data in documents]
             span.set_attribute("db.query.result_count", len(results))
             return results
         except Exception as e:
@@ -522,9 +976,21 @@ class RepositoryFirestore(FirestoreTracingMixin, Generic[T]):
 @component
 @ordered(1000)
 class TransactionPipeLine(CommandPipeLine):
-    def __init__(self, db: AsyncClient, ctx_tx: AsyncTransactionContext):
+    # Los parámetros de reintento van sin anotación: el contenedor resuelve
+    # como dependencia todo parámetro anotado
+    def __init__(
+        self,
+        db: AsyncClient,
+        ctx_tx: AsyncTransactionContext,
+        max_attempts=TRANSACTION_MAX_ATTEMPTS,
+        backoff_base=TRANSACTION_BACKOFF_BASE,
+        backoff_jitter=TRANSACTION_BACKOFF_JITTER,
+    ):
         self._db = db
         self._cts_tx = ctx_tx
+        self._max_attempts = max_attempts
+        self._backoff_base = backoff_base
+        self._backoff_jitter = backoff_jitter
 
     async def handler(
         self, context: PipelineContext, next_handler: Callable[[], Any]
@@ -539,10 +1005,23 @@ class TransactionPipeLine(CommandPipeLine):
             finally:
                 self._cts_tx.reset(token)
 
-        async with self._db.transaction() as tx:
-            result = await tx_wrapper(tx)
-
-        return result
+        # Solo se reintenta Aborted (la transacción perdió frente a otra por
+        # contención): se repite entera con backoff exponencial. El resto de
+        # Conflict, como AlreadyExists, es permanente y se propaga sin más
+        for attempt in range(1, self._max_attempts + 1):
+            try:
+                async with self._db.transaction() as tx:
+                    return await tx_wrapper(tx)
+            except Aborted as e:
+                if attempt == self._max_attempts:
+                    raise
+                delay = self._backoff_base * 2 ** (attempt - 1)
+                delay += random.random() * self._backoff_jitter
+                logger.warning(
+                    f"🔁 Transacción en conflicto (intento {attempt}/{self._max_attempts}), "
+                    f"reintentando en {delay:.2f}s: {e}"
+                )
+                await asyncio.sleep(delay)
 
 
 component(AsyncClient, provider_type=ProviderType.FACTORY, factory=get_db)
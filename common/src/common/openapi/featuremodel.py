@@ -38,6 +38,7 @@ class FeatureModel(BaseModel):
         if not isinstance(data, dict):
             return data
 
-        # Filtrar valores None
-        filtered_data = {k: v for k, v in data.items() if v is not None}
-        return filtered_data
+        # Filtrar valores None in-place (sin None no se crea otro dict)
+        for key in [k for k, v in data.items() if v is None]:
+            del data[key]
+        return data